@@ -3,22 +3,167 @@
 __authors__ = ["Christian O'Reilly", "Pierre-Alexandre Fonta"]
 __maintainer__ = "Pierre-Alexandre Fonta"
 
+import argparse
+import os
 import sys
 
+from PyQt5.QtCore import QCoreApplication, QTimer
 from PyQt5.QtWidgets import QApplication
 
-from neurocurator.mainWin import Window
+from neurocurator.profiling import StartupProfiler, profile_phase
 
 
 def main():
-    app = QApplication(sys.argv)
+    # NB: Recognized only as the first argument, to leave the other ones to Qt.
+    # A subparser would take the value of a Qt option (e.g. -style fusion) for a command.
+    if sys.argv[1:2] == ["import-pdfs"]:
+        import_parser = argparse.ArgumentParser(
+            prog="neurocurator import-pdfs",
+            description="Import the PDFs of a folder for the Zotero references they belong to.")
+        import_parser.add_argument("folder", help="folder of the PDFs, matched by the DOI or the PMID"
+                                                  " in their file name or their metadata")
+        import_parser.add_argument("--workers", type=_positive_int, default=None,
+                                   help="number of PDFs uploaded at the same time")
+        import_args = import_parser.parse_args(sys.argv[2:])
+        sys.exit(import_pdfs(import_args.folder, import_args.workers))
+
+    parser = argparse.ArgumentParser(prog="neurocurator",
+                                     epilog="Run 'neurocurator import-pdfs --help' to import"
+                                            " the PDFs of a folder without the GUI.")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print the duration of each phase of the startup")
+    # NB: The other arguments are left to Qt.
+    args, qt_args = parser.parse_known_args()
+
+    if args.profile_startup:
+        StartupProfiler().activate()
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    # NB: Imported here to measure the import of the application modules.
+    with profile_phase("Imports"):
+        from neurocurator.mainWin import Window
     window = Window()
     # FIXME DEBUG.
     # window.setGeometry(0, 0, 500, 1424)
     # /FIXME DEBUG.
     window.show()
+    profiler = StartupProfiler.active()
+    if profiler is not None:
+        startup = getattr(window, "startup", None)
+        if startup is not None and startup.running():
+            # NB: Reported once the loadings done in worker threads are finished too.
+            startup.finished.connect(profiler.report)
+        else:
+            # NB: Reported once the first events, including the display, have been processed.
+            QTimer.singleShot(0, profiler.report)
     sys.exit(app.exec_())
 
 
+def _positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1: " + text)
+    return value
+
+
+def import_pdfs(folder, max_workers=None):
+    """Import the PDFs of the folder without the GUI. Return the exit status."""
+    # NB: Imported here to not slow down the startup of the GUI.
+    from git.exc import GitCommandError
+    from nat.gitManager import GitManager, GitMngError
+    from nat.utils import Id2FileName
+    from neurocurator.batch_import import BatchImport
+    from neurocurator.ocr_monitor import OCRMonitor
+    from neurocurator.pdf_importer import ImportRESTClient
+    from neurocurator.settingsDlg import Settings
+    from neurocurator.utils import package_directory
+    from neurocurator.zotero_store import ZoteroStore
+
+    if not os.path.isdir(folder):
+        print("No such folder: " + folder, file=sys.stderr)
+        return 1
+    # NB: Needed by the QObjects used, like the timer of OCRMonitor.
+    app = QCoreApplication(sys.argv[:1])
+
+    try:
+        settings = Settings()
+    except FileNotFoundError:
+        print("No settings found. Please start the application once to set them.", file=sys.stderr)
+        return 1
+    try:
+        git_settings = settings.config["GIT"]
+        db_path = os.path.abspath(os.path.expanduser(git_settings["local"]))
+        zotero_settings = settings.config["ZOTERO"]
+        zotero = ZoteroStore(zotero_settings["libraryID"], zotero_settings["libraryType"],
+                             zotero_settings["apiKey"], package_directory())
+        rest_client = ImportRESTClient(settings.config["REST"]["serverURL"])
+    except KeyError as e:
+        print("Missing setting {}. Please set it in the preferences of the application.".format(e),
+              file=sys.stderr)
+        return 1
+    try:
+        zotero.sync()
+    except Exception as e:
+        print("Zotero can't be reached, the local references are used: {}".format(e), file=sys.stderr)
+    try:
+        zotero.load_cache()
+    except FileNotFoundError:
+        print("No Zotero references stored locally.", file=sys.stderr)
+        return 1
+    reference_ids = [zotero.reference_id(i) for i in range(zotero.reference_count())]
+
+    def report(result):
+        line = "{}: {}".format(os.path.basename(result.path), result.status)
+        if result.paper_id:
+            line += " ({})".format(result.paper_id)
+        if result.message:
+            line += ". " + result.message
+        print(line, flush=True)
+
+    batch_import = BatchImport(folder, reference_ids, db_path)
+    results = batch_import.run(rest_client.importPDF, report,
+                               max_workers or BatchImport.MAX_WORKERS)
+
+    # Annotation files of the imported papers.
+    pcr_paths = []
+    for result in results:
+        if result.status != BatchImport.IMPORTED:
+            continue
+        pcr_path = os.path.join(db_path, Id2FileName(result.paper_id)) + ".pcr"
+        if not os.path.isfile(pcr_path):
+            with open(pcr_path, "w", encoding="utf-8", errors="ignore"):
+                pass
+            pcr_paths.append(pcr_path)
+    is_committed = True
+    if pcr_paths:
+        # NB: GitManager() fetches and pulls. It raises ValueError if the Git server can't be reached.
+        try:
+            GitManager(git_settings).addFiles(pcr_paths)
+        except (GitMngError, GitCommandError, ValueError) as e:
+            is_committed = False
+            print("Failed to commit the annotation files: {}".format(e), file=sys.stderr)
+            for pcr_path in pcr_paths:
+                print("{}: not committed".format(os.path.basename(pcr_path)), flush=True)
+
+    # NB: The OCR of the papers is waited for by the application, at its next start.
+    ocr_papers = [result.paper_id for result in results if result.status == BatchImport.OCR_NEEDED]
+    if ocr_papers:
+        ocr_monitor = OCRMonitor(None)
+        ocr_monitor.restore()
+        for paper_id in ocr_papers:
+            ocr_monitor.add(paper_id, db_path)
+        ocr_monitor.shutdown()
+
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    print("{} PDF(s) processed: {}.".format(len(results), ", ".join(
+        "{} {}".format(count, status) for status, count in sorted(counts.items()))))
+    if not is_committed:
+        print("{} annotation file(s) not committed. They can be committed with Git in {}.".format(
+            len(pcr_paths), db_path))
+    return 1 if counts.get(BatchImport.FAILED) or not is_committed else 0
+
+
 if __name__ == "__main__":
     main()
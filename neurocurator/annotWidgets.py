@@ -564,7 +564,8 @@ class EditAnnotPositionWgt(QWidget):
                           self.container.currentAnnotation.localizer.x,
                           self.container.currentAnnotation.localizer.y,
                           self.container.currentAnnotation.localizer.width,
-                          self.container.currentAnnotation.localizer.height)
+                          self.container.currentAnnotation.localizer.height,
+                          self.imgThumbnail.size())
         self.imgThumbnail.setPixmap(pixmap)
 
 
@@ -0,0 +1,179 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from warnings import warn
+
+from nat.utils import fileName2Id
+from neurocurator.utils import atomic_open, package_directory
+
+
+class AnnotationCorpusIndex:
+    """Summaries of the annotation files (.pcr) of a database, kept on disk.
+
+    A file is parsed again only when its modification time or its size have
+    changed since it was summarized. Summaries are saved as JSON in the
+    package directory, one index per database path.
+
+    Thread-safe: the Zotero refresh thread and the GUI thread use it.
+    """
+
+    VERSION = 1
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_path, index_path=None):
+        self.db_path = os.path.abspath(db_path)
+        if index_path is None:
+            path_hash = hashlib.sha1(self.db_path.encode("utf-8")).hexdigest()[:12]
+            index_path = os.path.join(package_directory(),
+                                      "annotation_index-{}.json".format(path_hash))
+        self.index_path = index_path
+        # File name -> summary.
+        self._summaries = {}
+        self._is_dirty = False
+        self._lock = threading.RLock()
+        self._load()
+
+    @classmethod
+    def for_path(cls, db_path):
+        """Return the index shared by the whole process for this database path."""
+        db_path = os.path.abspath(db_path)
+        with cls._instances_lock:
+            if db_path not in cls._instances:
+                cls._instances[db_path] = cls(db_path)
+            return cls._instances[db_path]
+
+    # Data I/O methods section.
+
+    def update(self):
+        """Summarize the new and modified files, forget the deleted ones, and save."""
+        with self._lock:
+            seen = set()
+            try:
+                entries = list(os.scandir(self.db_path))
+            except FileNotFoundError:
+                entries = []
+            for entry in entries:
+                if not entry.name.endswith(".pcr") or not entry.is_file():
+                    continue
+                seen.add(entry.name)
+                self._update_entry(entry.name, entry.path, entry.stat())
+            for name in set(self._summaries) - seen:
+                del self._summaries[name]
+                self._is_dirty = True
+            self.save()
+
+    def update_file(self, path):
+        """Summarize again a file which has been written or deleted.
+
+        The index is not saved, to keep the cost of a save low. It is saved by
+        the next update() or save().
+        """
+        name = os.path.basename(path)
+        with self._lock:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if self._summaries.pop(name, None) is not None:
+                    self._is_dirty = True
+                return
+            self._update_entry(name, path, stat)
+
+    def save(self):
+        """Save the index if it has been modified."""
+        with self._lock:
+            if not self._is_dirty:
+                return
+            content = {"version": self.VERSION, "db_path": self.db_path,
+                       "files": self._summaries}
+            try:
+                with atomic_open(self.index_path, "w", encoding="utf-8") as f:
+                    json.dump(content, f)
+                self._is_dirty = False
+            except OSError as e:
+                warn("Failed to save the annotation index: {}".format(e))
+
+    # Public methods section.
+
+    def annotation_counts(self):
+        """Return the number of annotations per publication ID."""
+        counts = Counter()
+        with self._lock:
+            for summary in self._summaries.values():
+                counts.update(summary["pub_ids"])
+        return counts
+
+    def files_with_parameters(self):
+        """Return the paths of the files with annotations having parameters."""
+        with self._lock:
+            return sorted(os.path.join(self.db_path, name)
+                          for name, summary in self._summaries.items()
+                          if summary["parameter_ids"])
+
+    # Private methods section.
+
+    def _load(self):
+        """Load the saved index. Start from an empty one if it is unusable."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                content = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            warn("Failed to load the annotation index, it will be rebuilt: {}".format(e))
+            return
+        if content.get("version") == self.VERSION and content.get("db_path") == self.db_path:
+            self._summaries = content["files"]
+
+    def _update_entry(self, name, path, stat):
+        """Summarize the file if it has changed since the last summary."""
+        summary = self._summaries.get(name)
+        if (summary is not None and summary["mtime"] == stat.st_mtime_ns
+                and summary["size"] == stat.st_size):
+            return
+        try:
+            summary = self._summarize(path)
+        except (OSError, ValueError) as e:
+            warn("Failed to index the annotation file {}: {}".format(path, e))
+            return
+        summary["mtime"] = stat.st_mtime_ns
+        summary["size"] = stat.st_size
+        self._summaries[name] = summary
+        self._is_dirty = True
+
+    @staticmethod
+    def _summarize(path):
+        """Return the summary of an annotation file.
+
+        The JSON content is read directly. Building the nat Annotation objects
+        is not needed for a summary.
+        """
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            content = f.read()
+        # NB: An empty file is a paper without annotations (see Annotation.readIn()).
+        json_annotations = json.loads(content) if content.strip() else []
+        default_pub_id = fileName2Id(os.path.splitext(os.path.basename(path))[0])
+        pub_ids = []
+        annotation_ids = []
+        tag_ids = set()
+        parameter_ids = []
+        for json_annotation in json_annotations:
+            pub_ids.append(json_annotation.get("pubId", default_pub_id))
+            annotation_ids.append(json_annotation["annotId"])
+            tags = json_annotation.get("tags", [])
+            # NB: Tags were saved as a dictionary in older annotation files.
+            if isinstance(tags, dict):
+                tag_ids.update(tags.keys())
+            else:
+                tag_ids.update(tag["id"] for tag in tags)
+            parameter_ids.extend(param["id"] for param in json_annotation.get("parameters", []))
+        return {"pub_ids": pub_ids,
+                "annotation_ids": annotation_ids,
+                "tag_ids": sorted(tag_ids),
+                "parameter_ids": parameter_ids}
@@ -0,0 +1,167 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+
+from nat.annotation import Annotation
+from neurocurator.utils import atomic_open
+
+
+class AnnotationStore:
+    """Annotations of a paper, kept in memory between reads and writes of its file (.pcr).
+
+    The file is parsed again only when its modification time or its size have
+    changed since it was last read or written. Annotations are indexed by ID.
+
+    Writes replace the file atomically. The JSON of each annotation is kept,
+    so only the annotations which changed are serialized again. The file
+    content is the same as with Annotation.dump().
+
+    Annotations returned are copies, except by shared_annotations(). Modifying
+    them doesn't modify the store.
+    """
+
+    # Number of stores kept by for_path().
+    MAX_INSTANCES = 20
+
+    _instances = OrderedDict()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        # Annotation ID -> Annotation, in the order of the file.
+        self._annotations = OrderedDict()
+        # Annotation ID -> serialized JSON, indented as an element of the file list.
+        self._chunks = {}
+        # (modification time, size) of the file when it was last read or written.
+        self._signature = None
+        # Incremented each time the annotations change, to invalidate derived data.
+        self._generation = 0
+
+    @classmethod
+    def for_path(cls, path):
+        """Return the store shared by the whole process for this file."""
+        path = os.path.abspath(path)
+        with cls._instances_lock:
+            if path in cls._instances:
+                cls._instances.move_to_end(path)
+            else:
+                cls._instances[path] = cls(path)
+                while len(cls._instances) > cls.MAX_INSTANCES:
+                    cls._instances.popitem(last=False)
+            return cls._instances[path]
+
+    # Public methods section.
+
+    def annotations(self):
+        """Return copies of the annotations, in the order of the file.
+
+        Raise FileNotFoundError if the file doesn't exist.
+        """
+        self._load()
+        return [deepcopy(annotation) for annotation in self._annotations.values()]
+
+    def annotation(self, annotation_id):
+        """Return a copy of the annotation with this ID. Raise KeyError if there is none."""
+        self._load()
+        return deepcopy(self._annotations[annotation_id])
+
+    def generation(self):
+        """Return a number which changes each time the annotations change.
+
+        Raise FileNotFoundError if the file doesn't exist.
+        """
+        self._load()
+        return self._generation
+
+    def is_up_to_date(self):
+        """Check if the file has not been modified by another program since it was last read or written."""
+        try:
+            return self._stat_signature() == self._signature
+        except FileNotFoundError:
+            return self._signature is None
+
+    def shared_annotations(self):
+        """Return the annotations of the store, without copying them. They must not be modified."""
+        self._load()
+        return list(self._annotations.values())
+
+    def ids(self):
+        """Return the IDs of the annotations, in the order of the file."""
+        self._load()
+        return list(self._annotations)
+
+    def save(self, annotation):
+        """Replace the annotation with the same ID, or append it, and write the file."""
+        self.save_all([annotation])
+
+    def save_all(self, annotations):
+        """Replace the annotations with the same IDs, or append them, and write the file."""
+        self._load()
+        for annotation in annotations:
+            # NB: The caller may keep modifying its own annotation object.
+            self._annotations[annotation.ID] = deepcopy(annotation)
+            self._chunks.pop(annotation.ID, None)
+        self._write()
+
+    def delete(self, annotation_id):
+        """Remove the annotation with this ID and write the file. Raise KeyError if there is none."""
+        self._load()
+        del self._annotations[annotation_id]
+        self._chunks.pop(annotation_id, None)
+        self._write()
+
+    # Private methods section.
+
+    def _stat_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        """Read the file if it has changed since it was last read or written."""
+        try:
+            signature = self._stat_signature()
+        except FileNotFoundError:
+            self._annotations.clear()
+            self._chunks.clear()
+            self._signature = None
+            self._generation += 1
+            raise
+        if signature == self._signature:
+            return
+
+        with open(self.path, "r", encoding="utf-8", errors="ignore") as f:
+            content = f.read()
+        try:
+            # NB: An empty file is a paper without annotations.
+            annotations = Annotation.readIn(io.StringIO(content)) if content.strip() else []
+        except ValueError:
+            raise ValueError("Problem reading file " + self.path + ". The JSON coding of this file seems corrupted.")
+
+        self._annotations = OrderedDict((annotation.ID, annotation) for annotation in annotations)
+        self._chunks.clear()
+        self._signature = signature
+        self._generation += 1
+
+    def _write(self):
+        self._generation += 1
+        chunks = []
+        for annotation_id, annotation in self._annotations.items():
+            if annotation_id not in self._chunks:
+                self._chunks[annotation_id] = self._serialize(annotation)
+            chunks.append(self._chunks[annotation_id])
+        # NB: Same layout as json.dump(indent=4) of the list in Annotation.dump().
+        content = "[\n" + ",\n".join(chunks) + "\n]" if chunks else "[]"
+        with atomic_open(self.path, "w", encoding="utf-8", errors="ignore") as f:
+            f.write(content)
+        self._signature = self._stat_signature()
+
+    @staticmethod
+    def _serialize(annotation):
+        text = json.dumps(annotation.toJSON(), sort_keys=True, indent=4, separators=(',', ': '))
+        return "\n".join("    " + line for line in text.split("\n"))
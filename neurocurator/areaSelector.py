@@ -2,52 +2,192 @@
 
 __author__ = "Christian O'Reilly"
 
+import hashlib
 import os.path
-import pickle
+import re
+import threading
+from collections import OrderedDict
 from warnings import warn
 
 import numpy as np
-from PyQt5.QtCore import (pyqtSignal, pyqtSlot, QRect, QTimer, QSize, QObject,
-                          QThread, Qt)
-from PyQt5.QtGui import QPalette, QPixmap, QImage, QKeySequence
+from PyQt5.QtCore import (pyqtSignal, pyqtSlot, QRect, QSize, QObject,
+                          QThread, QMutex, QMutexLocker, QBuffer, QByteArray, Qt)
+from PyQt5.QtGui import QPalette, QPixmap, QImage, QImageReader, QKeySequence
 from PyQt5.QtWidgets import (QRubberBand, QLabel, QMenu, QMenuBar, QAction,
                              QVBoxLayout, QScrollArea, QSizePolicy,
-                             QHBoxLayout, QPushButton, QWidget, QDialog)
+                             QHBoxLayout, QPushButton, QWidget, QDialog,
+                             QMessageBox)
+from wand.exceptions import WandException
 from wand.image import Image
 
+from neurocurator.utils import atomic_open, package_directory
+
+
+rootRegExp      = re.compile(rb"/Root\s+(\d+)\s+(\d+)\s+R\b")
+pagesRegExp     = re.compile(rb"/Pages\s+(\d+)\s+(\d+)\s+R\b")
+pageCountRegExp = re.compile(rb"/Count\s+(\d+)")
+# Cross-reference streams, which can put the objects in compressed object streams.
+xrefStreamRegExp = re.compile(rb"/Type\s*/XRef\b|/XRefStm\b")
+
+def readObject(content, objNum, genNum):
+    """
+     Return the body of the last definition of the object in the PDF content,
+     or None if it is not defined outside of an object stream.
+    """
+    objRegExp = re.compile(rb"(?<!\d)" + objNum + rb"\s+" + genNum + rb"\s+obj\b(.*?)\bendobj",
+                           re.DOTALL)
+    bodies = objRegExp.findall(content)
+    # NB: An incremental update appends the new definition of an object.
+    return bodies[-1] if bodies else None
+
+def readPageCount(content):
+    """
+     Return the number of pages of the page tree of the document catalog
+     named by the last trailer of the PDF content, or None if it is not
+     readable without decompressing the PDF.
+    """
+    trailerInd = content.rfind(b"trailer")
+    if trailerInd == -1:
+        return None
+    trailer = content[trailerInd:]
+    if xrefStreamRegExp.search(trailer):
+        return None
+    root = rootRegExp.search(trailer)
+    catalog = readObject(content, *root.groups()) if root else None
+    pages = pagesRegExp.search(catalog) if catalog else None
+    pageTree = readObject(content, *pages.groups()) if pages else None
+    count = pageCountRegExp.search(pageTree) if pageTree else None
+    return int(count.group(1)) if count else None
+
+
+class PageCache:
+    """
+     Content-addressed cache of the rendered pages of a PDF. Each page is
+     rendered on demand, only once, and stored in its own PNG file, in a
+     directory named after the hash of the PDF content.
+    """
+
+    cacheDir = os.path.join(package_directory(), "renderingCache")
+
+    # Serializes the calls to ImageMagick, which are made from several threads.
+    renderingLock = threading.Lock()
+
+    # (file name, modification time, size) -> PageCache, to hash a PDF only once.
+    instances     = {}
+
+    @classmethod
+    def forFile(cls, fileName, resolution=150):
+        stat = os.stat(fileName)
+        key = (os.path.abspath(fileName), stat.st_mtime_ns, stat.st_size, resolution)
+        if key not in cls.instances:
+            cls.instances[key] = cls(fileName, resolution)
+        return cls.instances[key]
+
+    def __init__(self, fileName, resolution=150):
+        self.fileName   = fileName
+        self.resolution = resolution
+        with open(fileName, "rb") as f:
+            content = f.read()
+        self.pdfHash    = hashlib.sha1(content).hexdigest()
+        self.directory  = os.path.join(PageCache.cacheDir, self.pdfHash)
+        self._pageCount = readPageCount(content)
+
+    def pagePath(self, pageInd):
+        return os.path.join(self.directory, "{}-{}.png".format(self.resolution, pageInd))
+
+    def hasPage(self, pageInd):
+        return os.path.isfile(self.pagePath(pageInd))
+
+    @property
+    def pageCount(self):
+        if self._pageCount is None:
+            countFileName = os.path.join(self.directory, "pageCount")
+            try:
+                with open(countFileName, "r") as f:
+                    self._pageCount = int(f.read())
+            except (OSError, ValueError):
+                with PageCache.renderingLock:
+                    # NB: Slow for long papers, but pinging does not rasterize the pages.
+                    with Image(filename=self.fileName, ping=True) as pdf:
+                        self._pageCount = len(pdf.sequence)
+                self._write(countFileName, str(self._pageCount).encode("ascii"))
+        return self._pageCount
+
+    def page(self, pageInd):
+        """
+         Return the PNG blob of the page, rendering it if it is not cached.
+        """
+        try:
+            with open(self.pagePath(pageInd), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return self.renderPage(pageInd)
+
+    def renderPage(self, pageInd):
+        with PageCache.renderingLock:
+            # The page might have been rendered while waiting for the lock.
+            if self.hasPage(pageInd):
+                with open(self.pagePath(pageInd), "rb") as f:
+                    return f.read()
+
+            pageFileName = "{}[{}]".format(self.fileName, pageInd)
+            with Image(filename=pageFileName, resolution=self.resolution) as pdf:
+                with Image(width=pdf.width, height=pdf.height) as im:
+                    im.composite(pdf.sequence[0], top=0, left=0)
+                    blob = im.make_blob('png')
 
-class SplashDlg(QDialog):
+        self._write(self.pagePath(pageInd), blob)
+        return blob
 
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowFlags(Qt.SplashScreen | Qt.WindowStaysOnTopHint)
-        layout = QVBoxLayout()
-        layout.addWidget(QLabel("Please wait while rendering PDF pages...", self))
-        self.setLayout(layout)
+    def _write(self, fileName, content):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with atomic_open(fileName, "wb") as f:
+                f.write(content)
+        except OSError:
+            warn("Failed to cache the rendering of the PDF paper.")
 
 
-class RenderingThread(QThread):
 
-    def __init__(self, parent=None):
+class PrefetchThread(QThread):
+    """
+     Render in the background the pages which are likely to be displayed next.
+    """
+
+    def __init__(self, pageCache, parent=None):
         super().__init__(parent)
-        self._parent = parent
-        self.renderingFinished     = False
+        self.pageCache = pageCache
+        self.queue     = []
+        self.mutex     = QMutex()
 
-    def run(self):
-        self._parent.pages = []
-        with Image(filename=self._parent.fileName, resolution=self._parent.resolution) as pdf:
-            pages = len(pdf.sequence)
-            for i in range(pages):
-                with Image(width=pdf.width, height=pdf.height) as im:
-                    im.composite(pdf.sequence[i], top=0, left=0)
-                    self._parent.pages.append(im.make_blob('png'))
+    def prefetch(self, pageInds):
+        with QMutexLocker(self.mutex):
+            # The most recent request has the priority.
+            self.queue = [ind for ind in pageInds if not self.pageCache.hasPage(ind)]
+        if not self.isRunning():
+            self.start()
 
+    def run(self):
+        pageCount = self.pageCache.pageCount
+        while not self.isInterruptionRequested():
+            with QMutexLocker(self.mutex):
+                self.queue = [ind for ind in self.queue if ind < pageCount]
+                if not self.queue:
+                    return
+                pageInd = self.queue.pop(0)
+            try:
+                self.pageCache.page(pageInd)
+            except Exception as e:
+                warn("Failed to render the page {} of the PDF paper: {}".format(pageInd+1, e))
 
 
 class PDFAreaSelector(QObject):
 
     areaSelected = pyqtSignal()
 
+    # Number of decoded pages kept in memory.
+    nbPagesInMemory = 5
+
     def exec_(self):
         self.open()
 
@@ -56,67 +196,43 @@ class PDFAreaSelector(QObject):
 
         self.fileName = fileName
         self.resolution = 150
-        self.pages = []
+        self.pages = OrderedDict()
         self.currentPageInd = 0
+        self.pageCache = PageCache.forFile(fileName, self.resolution)
+        self.prefetchThread = PrefetchThread(self.pageCache, self)
+
+    @property
+    def pageCount(self):
+        return self.pageCache.pageCount
+
+    def page(self, pageInd):
+        """
+         Return the PNG blob of the page. The requested page is rendered first,
+         then its neighbours are rendered in the background.
+        """
+        if pageInd in self.pages:
+            self.pages.move_to_end(pageInd)
+        else:
+            self.pages[pageInd] = self.pageCache.page(pageInd)
+            while len(self.pages) > PDFAreaSelector.nbPagesInMemory:
+                self.pages.popitem(last=False)
+
+        # NB: Pages after the last one are discarded by the prefetching thread,
+        # once it knows the number of pages.
+        neighbours = [pageInd+1, pageInd-1, pageInd+2]
+        self.prefetchThread.prefetch([ind for ind in neighbours if ind >= 0])
+        return self.pages[pageInd]
 
     def open(self, interactive=True):
         self.isInteractive = interactive
-        if self.hasBeenCached():
-            self.loadCachedRendering()
-            if not self.pages is None:
-                # Loading cached version succeeded
-                if interactive:
-                    self.selectDlg = PDFAreaSelectorDlg(self)
-                    self.selectDlg.exec_()
-                return
-
-        self.waitWidget = SplashDlg()
-        self.waitWidget.show()
-
-        self.renderThread = RenderingThread(self)
-        self.renderThread.start()
-        self.renderThread.finished.connect(self.pdfRendered)
-
-
-    @pyqtSlot()
-    def pdfRendered(self):
-        
-        self.waitWidget.close()
-        if self.isInteractive:
+        if interactive:
             self.selectDlg = PDFAreaSelectorDlg(self)
             self.selectDlg.exec_()
-        self.cacheRendering()        
-
-
-    def cacheRendering(self):
-        fileName = self.fileName + "_cachedRendering"
-        try:
-            with open(fileName, 'wb') as f:
-                pickle.dump(self.pages, f)
-        except:
-            warn("Failed to cach the rendering of the PDF paper.")
-            pass
-
-
-    def loadCachedRendering(self):
-        fileName = self.fileName + "_cachedRendering"
-        try:
-            with open(fileName, 'rb') as f:
-                self.pages = pickle.load(f)
-        except:
-            warn("Failed to load the cached rendering of the PDF paper.")
-            self.pages = None
-
-
-
-    def hasBeenCached(self):
-        return os.path.isfile(self.fileName + "_cachedRendering") 
-
-
-
-
-
+            self.close()
 
+    def close(self):
+        self.prefetchThread.requestInterruption()
+        self.prefetchThread.wait()
 
 
 
@@ -185,7 +301,18 @@ class PDFAreaSelectorDlg(QDialog):
 
 
     def loadImage(self):
-        image = QImage.fromData(self._parent.pages[self._parent.currentPageInd],"PNG")
+        try:
+            blob = self._parent.page(self._parent.currentPageInd)
+        except (WandException, OSError) as e:
+            msgBox = QMessageBox(self)
+            msgBox.setWindowTitle("Rendering error")
+            msgBox.setText("The page {} of the PDF could not be rendered: {}"
+                           .format(self._parent.currentPageInd+1, e))
+            msgBox.setStandardButtons(QMessageBox.Ok)
+            msgBox.exec_()
+            return False
+
+        image = QImage.fromData(blob, "PNG")
 
         self.imageLabel.setPixmap(QPixmap.fromImage(image))
         self.fitToWindowAct.setEnabled(True)
@@ -310,15 +437,17 @@ class PDFAreaSelectorDlg(QDialog):
 
 
     def nextPage(self):
-        if self._parent.currentPageInd < len(self._parent.pages)-1:
+        if self._parent.currentPageInd < self._parent.pageCount-1:
             self._parent.currentPageInd += 1
-            self.loadImage()
+            if not self.loadImage():
+                self._parent.currentPageInd -= 1
             self.noPageTxt.setText(str(self._parent.currentPageInd+1))
 
     def previousPage(self):
         if self._parent.currentPageInd > 0:
             self._parent.currentPageInd -= 1
-            self.loadImage()
+            if not self.loadImage():
+                self._parent.currentPageInd += 1
             self.noPageTxt.setText(str(self._parent.currentPageInd+1))
 
 
@@ -384,30 +513,83 @@ class ImageWidget(QLabel):
 
 
 
-def loadImage(fileName, pageNo, x, y, width, height):
-
-    areaSelector = PDFAreaSelector(fileName)
-    areaSelector.open(interactive=False)
-    i = 0
-    timer = QTimer()
-    while len(areaSelector.pages) == 0 and i < 120:
-        i += 1
-        timer.start(500)
-        
-    image = QImage.fromData(areaSelector.pages[pageNo-1],"PNG")
-    pixmap = QPixmap.fromImage(image)
-
-    pixmapSize = pixmap.size()
-    widthImg  = pixmapSize.width()
-    heightImg = pixmapSize.height()
-
-    rect = QRect(x*widthImg, y*heightImg, width*widthImg, height*heightImg)
-    return pixmap.copy(rect)
-    
-
-
-
+class ThumbnailCache:
+    """
+     Crops of PDF pages, cached in memory and on disk. Only the page
+     containing the area is rendered (or loaded from the page cache), and
+     only the area is decoded.
+    """
+
+    # Number of thumbnails kept in memory.
+    nbThumbnailsInMemory = 50
+
+    def __init__(self):
+        self.thumbnails = OrderedDict()
+
+    def thumbnail(self, fileName, pageNo, x, y, width, height, size=None):
+        """
+         Return a QPixmap of the area of the page. (x, y, width, height) are
+         relative to the size of the page. If size (QSize) is given, the
+         thumbnail is scaled to fit into it, keeping its aspect ratio.
+        """
+        pageCache = PageCache.forFile(fileName)
+        sizeKey   = (size.width(), size.height()) if size is not None else None
+        key       = (pageCache.pdfHash, pageNo, (x, y, width, height), sizeKey)
+
+        if key in self.thumbnails:
+            self.thumbnails.move_to_end(key)
+            return self.thumbnails[key]
+
+        thumbnailFileName = self.thumbnailPath(pageCache, key)
+        image = QImage(thumbnailFileName) if os.path.isfile(thumbnailFileName) else QImage()
+        if image.isNull():
+            image = self.cropPage(pageCache, pageNo, x, y, width, height)
+            if size is not None:
+                image = image.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            self.saveThumbnail(pageCache, thumbnailFileName, image)
+
+        pixmap = QPixmap.fromImage(image)
+        self.thumbnails[key] = pixmap
+        while len(self.thumbnails) > ThumbnailCache.nbThumbnailsInMemory:
+            self.thumbnails.popitem(last=False)
+        return pixmap
+
+    @staticmethod
+    def thumbnailPath(pageCache, key):
+        keyHash = hashlib.sha1(repr(key[1:]).encode("utf-8")).hexdigest()
+        return os.path.join(pageCache.directory, "thumbnails",
+                            "{}-{}.png".format(pageCache.resolution, keyHash))
+
+    @staticmethod
+    def cropPage(pageCache, pageNo, x, y, width, height):
+        buffer = QBuffer()
+        buffer.setData(QByteArray(pageCache.page(pageNo-1)))
+        reader = QImageReader(buffer, b"PNG")
+        pageSize = reader.size()
+        # NB: Only the clipped area is kept in memory.
+        reader.setClipRect(QRect(int(x*pageSize.width()), int(y*pageSize.height()),
+                                 int(width*pageSize.width()), int(height*pageSize.height())))
+        image = reader.read()
+        if image.isNull():
+            raise ValueError("Failed to decode the page {} of {}: {}"
+                             .format(pageNo, pageCache.fileName, reader.errorString()))
+        return image
+
+    @staticmethod
+    def saveThumbnail(pageCache, fileName, image):
+        buffer = QBuffer()
+        buffer.open(QBuffer.WriteOnly)
+        image.save(buffer, "PNG")
+        try:
+            os.makedirs(os.path.dirname(fileName), exist_ok=True)
+            with atomic_open(fileName, "wb") as f:
+                f.write(bytes(buffer.data()))
+        except OSError:
+            warn("Failed to cache the thumbnail of the PDF paper.")
 
 
+thumbnailCache = ThumbnailCache()
 
 
+def loadImage(fileName, pageNo, x, y, width, height, size=None):
+    return thumbnailCache.thumbnail(fileName, pageNo, x, y, width, height, size)
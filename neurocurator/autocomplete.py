@@ -1,49 +1,125 @@
 from sys import platform as _platform
 
-from PyQt5.QtCore import (pyqtSignal, QSortFilterProxyModel, QStringListModel,
-                          QEvent, QRegExp, Qt)
+from PyQt5.QtCore import (pyqtSignal, QAbstractListModel, QModelIndex,
+                          QStringListModel, QEvent, Qt)
+from PyQt5.QtGui import QStandardItemModel
 from PyQt5.QtWidgets import QCompleter, QComboBox
 
+from .name_index import NameIndex
+
+
+class NameListModel(QAbstractListModel):
+    """
+     List of the names of a NameIndex, in its ranking order, to be shared by
+     several views. Rows are materialized by batches, when views ask for
+     them (see canFetchMore() and fetchMore()).
+    """
+
+    batchSize = 100
+
+    def __init__(self, nameIndex, parent=None):
+        super().__init__(parent)
+        self.nameIndex = nameIndex
+        # NB: QComboBox doesn't show the drop-down list of an empty model.
+        self.nbFetchedRows = min(self.batchSize, len(nameIndex))
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.nbFetchedRows
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            return self.nameIndex.name_at(index.row())
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self.nbFetchedRows < len(self.nameIndex)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        nbRows = min(self.batchSize, len(self.nameIndex) - self.nbFetchedRows)
+        if nbRows <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.nbFetchedRows, self.nbFetchedRows + nbRows - 1)
+        self.nbFetchedRows += nbRows
+        self.endInsertRows()
+
+    def addName(self, name):
+        if name in self.nameIndex:
+            return
+        self.nameIndex.add(name)
+        self.insertFetchedRow(self.nameIndex.rank(name))
+
+    def setUsage(self, name, count):
+        if not name in self.nameIndex:
+            return
+        oldRow = self.nameIndex.rank(name)
+        self.nameIndex.set_usage(name, count)
+        newRow = self.nameIndex.rank(name)
+        if newRow == oldRow:
+            return
+        if oldRow < self.nbFetchedRows:
+            self.beginRemoveRows(QModelIndex(), oldRow, oldRow)
+            self.nbFetchedRows -= 1
+            self.endRemoveRows()
+        self.insertFetchedRow(newRow)
+
+    def insertFetchedRow(self, row):
+        # NB: Rows after the fetched ones are added when they are fetched.
+        if row <= self.nbFetchedRows and self.nbFetchedRows < len(self.nameIndex):
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.nbFetchedRows += 1
+            self.endInsertRows()
+
 
 class CustomQCompleter(QCompleter):
     """
     adapted from: http://stackoverflow.com/a/7767999/2156909
+
+    Completions are the names containing the typed text, whatever the case,
+    found with a NameIndex and ranked by usage.
     """
 
+    # Maximal number of completions proposed.
+    maxCompletions = 100
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.local_completion_prefix = ""
-        self.source_model = None
-        self.filterProxyModel = QSortFilterProxyModel(self)
-        self.usingOriginalModel = False
-
-    def setModel(self, strList): 
-        self.source_model = QStringListModel(strList)
-        self.filterProxyModel = QSortFilterProxyModel(self)
-        self.filterProxyModel.setSourceModel(self.source_model)
-        super().setModel(self.filterProxyModel)
-        self.usingOriginalModel = True
-
+        self.nameIndex = NameIndex([])
+        self.matchModel = QStringListModel(self)
+        super().setModel(self.matchModel)
+
+    def setModel(self, strList, usage=None):
+        """
+         usage gives, for some names, their number of uses. The most used
+         names are proposed first.
+        """
+        self.setNameIndex(NameIndex(strList, usage))
+
+    def setNameIndex(self, nameIndex):
+        self.nameIndex = nameIndex
+        # NB: QComboBox.setModel() may have given its model to the completer.
+        if self.model() is not self.matchModel:
+            super().setModel(self.matchModel)
+        self.updateModel()
 
     def updateModel(self):
-        if not self.usingOriginalModel:
-            self.filterProxyModel.setSourceModel(self.source_model)
-
-        pattern = QRegExp(self.local_completion_prefix,
-                                Qt.CaseInsensitive,
-                                QRegExp.FixedString)
-
-        self.filterProxyModel.setFilterRegExp(pattern)
+        matches = self.nameIndex.search(self.local_completion_prefix, self.maxCompletions)
+        if not matches:
+            matches = [self.local_completion_prefix]
+        self.matchModel.setStringList(matches)
 
     def splitPath(self, path):
         self.local_completion_prefix = path
         self.updateModel()
-        if self.filterProxyModel.rowCount() == 0:
-            self.usingOriginalModel = False
-            self.filterProxyModel.setSourceModel(QStringListModel([path]))
-            return [path]
-
-        self.usingOriginalModel = True
+        # NB: The model contains only matching names. The completer must not filter them.
         return []
 
 class AutoCompleteEdit(QComboBox):
@@ -54,6 +130,7 @@ class AutoCompleteEdit(QComboBox):
         super().__init__(parent)
         self.setEditable(True)
         self.setInsertPolicy(self.NoInsert)
+        self.sharedModel = None
         self.comp = CustomQCompleter(self)
         self.comp.setCompletionMode(QCompleter.PopupCompletion)
         self.setCompleter(self.comp)
@@ -61,10 +138,61 @@ class AutoCompleteEdit(QComboBox):
         self.erase = False
         self.deactivateClearing = False
 
-    def setModel(self, strList):
+    def setModel(self, strList, usage=None):
+        if not self.sharedModel is None:
+            self.sharedModel = None
+            super().setModel(QStandardItemModel(self))
         self.clear()
         self.insertItems(0, strList)
-        self.comp.setModel(strList)
+        self.comp.setModel(strList, usage)
+
+    def setSharedModel(self, nameListModel):
+        """
+         Propose the names of a NameListModel, which can be shared by several
+         widgets. Its rows are created only when the drop-down list needs them.
+        """
+        self.sharedModel = nameListModel
+        text = self.currentText()
+        super().setModel(nameListModel)
+        self.comp.setNameIndex(nameListModel.nameIndex)
+        self.setEditText(text)
+
+    def addName(self, name):
+        """
+         Add a name to the proposed names, without rebuilding the list.
+        """
+        if not self.sharedModel is None:
+            self.sharedModel.addName(name)
+            return
+        if name in self.comp.nameIndex:
+            return
+        self.comp.nameIndex.add(name)
+        self.moveItem(name, None, self.comp.nameIndex.rank(name))
+
+    def setUsage(self, name, count):
+        """
+         Set the number of uses of a proposed name and move it accordingly.
+        """
+        if not self.sharedModel is None:
+            self.sharedModel.setUsage(name, count)
+            return
+        if not name in self.comp.nameIndex:
+            return
+        oldRow = self.comp.nameIndex.rank(name)
+        self.comp.nameIndex.set_usage(name, count)
+        newRow = self.comp.nameIndex.rank(name)
+        if newRow != oldRow:
+            self.moveItem(name, oldRow, newRow)
+
+    def moveItem(self, name, oldRow, newRow):
+        # NB: The edited text must not change, even if it is the moved item.
+        text = self.currentText()
+        self.blockSignals(True)
+        if not oldRow is None:
+            self.removeItem(oldRow)
+        self.insertItem(newRow, name)
+        self.setEditText(text)
+        self.blockSignals(False)
 
     def focusInEvent(self, event):
         
@@ -0,0 +1,157 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from nat.restClient import RESTImportPDFErr
+from nat.utils import fileName2Id
+from neurocurator.paper_status import PaperStatusIndex
+
+
+# Outcome of the import of a PDF of a folder.
+# path: path of the PDF.
+# paper_id: ID of the Zotero reference it belongs to, or None if there is none.
+# status: one of the statuses of BatchImport.
+# message: error message, or ''.
+BatchImportResult = namedtuple("BatchImportResult", ["path", "paper_id", "status", "message"])
+
+
+class PaperMatcher:
+    """Find the Zotero reference a PDF belongs to, from the DOI or the PMID it contains.
+
+    The DOI or the PMID is looked for in the file name, then in the first and
+    last bytes of the PDF, where its metadata (Info dictionary, XMP) usually
+    are. Only the IDs of the given references are matched.
+    """
+
+    # Number of bytes read at the beginning and at the end of a PDF.
+    READ_SIZE = 256 * 1024
+
+    DOI_PATTERN = re.compile(r"10\.\d{4,9}[/_][^\s\"'<>()\[\]{}]+", re.IGNORECASE)
+    PMID_PATTERN = re.compile(r"pmid\W{0,2}(\d{1,9})", re.IGNORECASE)
+
+    def __init__(self, reference_ids):
+        # Matching key -> reference ID.
+        self._ids = {self._key(ref_id): ref_id for ref_id in reference_ids if ref_id}
+
+    def match(self, pdf_path):
+        """Return the ID of the reference the PDF belongs to, or None if there is none."""
+        name = fileName2Id(os.path.splitext(os.path.basename(pdf_path))[0])
+        ref_id = self._match_text(name, whole=True)
+        if ref_id is None:
+            ref_id = self._match_text(self._read_metadata(pdf_path))
+        return ref_id
+
+    # Private methods section.
+
+    @staticmethod
+    def _key(ref_id):
+        # NB: DOIs are case-insensitive. Slashes are often replaced by underscores in file names.
+        return ref_id.lower().replace("/", "_")
+
+    def _match_text(self, text, whole=False):
+        candidates = [text] if whole else []
+        # NB: Trailing punctuation is not part of a DOI.
+        candidates.extend(doi.rstrip(".,;:") for doi in self.DOI_PATTERN.findall(text))
+        candidates.extend("PMID_" + pmid for pmid in self.PMID_PATTERN.findall(text))
+        for candidate in candidates:
+            ref_id = self._ids.get(self._key(candidate))
+            if ref_id is not None:
+                return ref_id
+        return None
+
+    def _read_metadata(self, pdf_path):
+        try:
+            with open(pdf_path, "rb") as f:
+                head = f.read(self.READ_SIZE)
+                f.seek(0, os.SEEK_END)
+                f.seek(max(len(head), f.tell() - self.READ_SIZE))
+                tail = f.read()
+        except OSError:
+            return ""
+        return (head + b"\n" + tail).decode("latin-1")
+
+
+class BatchImport:
+    """Import the PDFs of a folder for the Zotero references they belong to.
+
+    The PDFs are uploaded concurrently, by a bounded pool of threads, with
+    import_fct(pdf_path, paper_id, db_path), like RESTClient.importPDF().
+    PDFs already imported are skipped. Creating the annotation files of the
+    imported papers is left to the caller.
+    """
+
+    # Statuses.
+    UNMATCHED = "no matching reference"
+    ALREADY_IMPORTED = "already imported"
+    DUPLICATE = "other PDF for the same reference"
+    IMPORTED = "imported"
+    OCR_NEEDED = "OCR needed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    # Maximum number of PDFs uploaded at the same time.
+    MAX_WORKERS = 4
+
+    def __init__(self, folder, reference_ids, db_path):
+        self.folder = folder
+        self.db_path = db_path
+        self._matcher = PaperMatcher(reference_ids)
+
+    def pdf_paths(self):
+        """Return the paths of the PDFs of the folder."""
+        return sorted(os.path.join(self.folder, name) for name in os.listdir(self.folder)
+                      if name.lower().endswith(".pdf"))
+
+    def match(self):
+        """Return the PDFs to import as (path, paper ID), and the results of the other ones."""
+        status_index = PaperStatusIndex.for_path(self.db_path)
+        status_index.update()
+        to_import = []
+        skipped = []
+        paper_ids = set()
+        for path in self.pdf_paths():
+            paper_id = self._matcher.match(path)
+            if paper_id is None:
+                skipped.append(BatchImportResult(path, None, self.UNMATCHED, ""))
+            elif paper_id in paper_ids:
+                skipped.append(BatchImportResult(path, paper_id, self.DUPLICATE, ""))
+            elif status_index.status(paper_id) == PaperStatusIndex.COMPLETE:
+                skipped.append(BatchImportResult(path, paper_id, self.ALREADY_IMPORTED, ""))
+            else:
+                paper_ids.add(paper_id)
+                to_import.append((path, paper_id))
+        return to_import, skipped
+
+    def run(self, import_fct, report=None, max_workers=MAX_WORKERS):
+        """Import the matched PDFs and return the result for each PDF of the folder.
+
+        report is called with each result, in the calling thread, as soon as
+        it is known.
+        """
+        to_import, results = self.match()
+        if report is not None:
+            for result in results:
+                report(result)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(import_fct, path, paper_id, self.db_path): (path, paper_id)
+                       for path, paper_id in to_import}
+            for future in as_completed(futures):
+                path, paper_id = futures[future]
+                result = BatchImportResult(path, paper_id, *self.outcome(future.exception()))
+                results.append(result)
+                if report is not None:
+                    report(result)
+        return results
+
+    @classmethod
+    def outcome(cls, exception):
+        """Return the status and the message of an import, from the exception it raised or None."""
+        if exception is None:
+            return cls.IMPORTED, ""
+        if isinstance(exception, RESTImportPDFErr):
+            return cls.OCR_NEEDED, str(exception)
+        return cls.FAILED, str(exception)
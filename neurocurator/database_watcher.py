@@ -0,0 +1,96 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import os
+
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal, pyqtSlot
+
+from neurocurator.paper_status import PaperStatusIndex
+
+
+class DatabaseWatcher(QObject):
+    """Report the files of the papers created, modified or deleted in the database directory.
+
+    The directory is watched with QFileSystemWatcher (inotify on Linux). Its
+    notifications don't tell which files changed, so the directory is scanned
+    again, once the changes have settled, and compared with the previous scan
+    on the modification time and the size of each file.
+
+    Files written through atomic_open() and by Git (checkout, pull, ...) are
+    replaced, which is a change of the directory. Files modified in place by
+    another program are reported at the next change of the directory.
+    """
+
+    # Emitted with the paths of the files created, modified or deleted.
+    filesChanged = pyqtSignal(list)
+
+    # Delay in milliseconds to wait for the changes to settle, e.g. during a git pull.
+    DELAY = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.db_path = None
+        # File name -> (modification time, size).
+        self._signatures = {}
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._directory_changed)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DELAY)
+        self._timer.timeout.connect(self.check)
+
+    def watch(self, db_path):
+        """Watch this database directory instead of the current one."""
+        if self._watcher.directories():
+            self._watcher.removePaths(self._watcher.directories())
+        self._timer.stop()
+        self.db_path = os.path.abspath(db_path)
+        self._signatures = self._scan()
+        self._add_path()
+
+    # Slots section.
+
+    @pyqtSlot()
+    def check(self):
+        """Scan the directory and report the files which changed since the previous scan."""
+        if self.db_path is None:
+            return
+        signatures = self._scan()
+        changed = [name for name, signature in signatures.items()
+                   if self._signatures.get(name) != signature]
+        changed.extend(name for name in self._signatures if name not in signatures)
+        self._signatures = signatures
+        # NB: A removed directory is not watched anymore. It is watched again if it is recreated.
+        self._add_path()
+        if changed:
+            self.filesChanged.emit(sorted(os.path.join(self.db_path, name) for name in changed))
+
+    # Private methods section.
+
+    @pyqtSlot(str)
+    def _directory_changed(self, path):
+        # NB: Restarted at each change, to scan once per burst of changes.
+        self._timer.start()
+
+    def _add_path(self):
+        if self.db_path not in self._watcher.directories() and os.path.isdir(self.db_path):
+            self._watcher.addPath(self.db_path)
+
+    def _scan(self):
+        """Return the modification time and the size of each file of a paper."""
+        signatures = {}
+        try:
+            entries = list(os.scandir(self.db_path))
+        except FileNotFoundError:
+            return signatures
+        for entry in entries:
+            if os.path.splitext(entry.name)[1] not in PaperStatusIndex.EXTENSIONS:
+                continue
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    signatures[entry.name] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                # NB: Deleted during the scan.
+                continue
+        return signatures
@@ -4,9 +4,7 @@ __author__ = "Christian O'Reilly"
 
 from PyQt5.QtWidgets import QHBoxLayout, QAbstractItemView, QWidget
 
-from nat.annotation import getParametersForPub
 from nat.paramDesc import ParamRef
-from nat.utils import Id2FileName
 
 from .paramFunctionWgt import ParameterInstanceTableView, ParameterInstanceListModel
 
@@ -40,7 +38,7 @@ class ExpPropWgt(QWidget):
         if self.main_window.currentAnnotation is None:
             return
             
-        parameters = getParametersForPub(self.main_window.dbPath, Id2FileName(self.main_window.currentAnnotation.pubId))
+        parameters = self.main_window.paperSession.parameters()
         parameters = [param for param in parameters if param.isExperimentProperty == True]
 
         if checkAll:
@@ -0,0 +1,187 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+from git import RemoteProgress
+from PyQt5.QtCore import (QObject, QThread, QTimer, QMetaObject, Qt,
+                          pyqtSignal, pyqtSlot)
+
+
+class GitWorker(QObject):
+    """Perform the Git operations of the annotation database in its own thread.
+
+    Files to stage are queued. Files queued several times before a commit are
+    staged once. Queued files are committed together after a delay without
+    new files, or before a push.
+
+    Not to be used directly. See GitPipeline.
+    """
+
+    # Emitted with the paths of the files committed together.
+    committed = pyqtSignal(list)
+    pushStarted = pyqtSignal()
+    # Emitted with the current count, the maximum count and a message.
+    pushProgress = pyqtSignal(int, int, str)
+    # Emitted with the git.FetchInfo of the push, or None if Git is offline.
+    pushFinished = pyqtSignal(object)
+    # Emitted with the error message of a failed operation.
+    failed = pyqtSignal(str)
+
+    def __init__(self, commit_delay):
+        super().__init__()
+        # NB: The QObject doesn't have a parent to be movable to another thread.
+        self._git_manager = None
+        self._pending = set()
+        self._commit_delay = commit_delay
+        self._timer = None
+
+    # Slots section. Executed in the worker thread.
+
+    @pyqtSlot(object)
+    def set_git_manager(self, git_manager):
+        # NB: Files queued for the previous repository are committed in it.
+        self.commit()
+        self._git_manager = git_manager
+        # NB: Files queued before a repository was set are committed in this one.
+        self.commit()
+
+    @pyqtSlot(list)
+    def add_files(self, paths):
+        self._pending.update(paths)
+        if self._timer is None:
+            # NB: Created here to belong to the worker thread.
+            self._timer = QTimer()
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self.commit)
+        self._timer.start(self._commit_delay)
+
+    @pyqtSlot()
+    def commit(self):
+        if self._timer is not None:
+            self._timer.stop()
+        if not self._pending or self._git_manager is None:
+            return
+        paths = sorted(self._pending)
+        try:
+            self._git_manager.addFiles(paths)
+        except Exception as e:
+            # NB: The files stay queued to be committed with the next batch.
+            self.failed.emit("Failed to commit the annotation files: {}".format(e))
+            return
+        self._pending.difference_update(paths)
+        self.committed.emit(paths)
+
+    @pyqtSlot()
+    def push(self):
+        self.commit()
+        if self._git_manager is None:
+            return
+        self.pushStarted.emit()
+        try:
+            info = self._push()
+        except Exception as e:
+            self.failed.emit("Failed to push to the server: {}".format(e))
+            return
+        self.pushFinished.emit(info)
+
+    @pyqtSlot()
+    def flush(self):
+        self.commit()
+
+    # Private methods section.
+
+    def _push(self):
+        """Push like GitManager.push(), reporting the progress of the transfer."""
+        git_manager = self._git_manager
+        if not git_manager.canRunRemoteCmd():
+            return None
+        progress = _PushProgress(self.pushProgress)
+        # NB: no_thin as in GitManager.push(), see its docstring.
+        return git_manager.repo.remotes.origin.push(no_thin=True, progress=progress)[0]
+
+
+class _PushProgress(RemoteProgress):
+    """Forward the progress reported by Git to a Qt signal."""
+
+    def __init__(self, signal):
+        super().__init__()
+        self._signal = signal
+
+    def update(self, op_code, cur_count, max_count=None, message=""):
+        self._signal.emit(int(cur_count), int(max_count or 0), message or "")
+
+
+class GitPipeline(QObject):
+    """Give the GUI thread a non-blocking access to the Git operations.
+
+    Methods return immediately. Results are reported with the signals, which
+    are delivered in the GUI thread.
+    """
+
+    committed = pyqtSignal(list)
+    pushStarted = pyqtSignal()
+    pushProgress = pyqtSignal(int, int, str)
+    pushFinished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    # Requests to the worker, queued in its thread.
+    _set_git_manager_requested = pyqtSignal(object)
+    _add_files_requested = pyqtSignal(list)
+    _commit_requested = pyqtSignal()
+    _push_requested = pyqtSignal()
+
+    def __init__(self, git_manager=None, commit_delay=2000, parent=None):
+        """Start the worker thread.
+
+        commit_delay is the time, in milliseconds, without new files after
+        which the queued files are committed.
+        """
+        super().__init__(parent)
+        self._thread = QThread()
+        self._worker = GitWorker(commit_delay)
+        self._worker.moveToThread(self._thread)
+
+        self._set_git_manager_requested.connect(self._worker.set_git_manager)
+        self._add_files_requested.connect(self._worker.add_files)
+        self._commit_requested.connect(self._worker.commit)
+        self._push_requested.connect(self._worker.push)
+
+        self._worker.committed.connect(self.committed)
+        self._worker.pushStarted.connect(self.pushStarted)
+        self._worker.pushProgress.connect(self.pushProgress)
+        self._worker.pushFinished.connect(self.pushFinished)
+        self._worker.failed.connect(self.failed)
+
+        self._thread.start()
+        if git_manager is not None:
+            self.set_git_manager(git_manager)
+
+    def set_git_manager(self, git_manager):
+        """Use this GitManager for the next operations.
+
+        The GitManager must not be used afterwards by the caller.
+        """
+        self._set_git_manager_requested.emit(git_manager)
+
+    def add_files(self, paths):
+        """Queue files to be staged and committed."""
+        self._add_files_requested.emit(list(paths))
+
+    def commit(self):
+        """Commit the queued files without waiting."""
+        self._commit_requested.emit()
+
+    def push(self):
+        """Commit the queued files and push to the server."""
+        self._push_requested.emit()
+
+    def flush(self):
+        """Wait for the requested operations to be done and commit the queued files."""
+        if self._thread.isRunning():
+            # NB: Requests are processed in order. The previous ones are done when it returns.
+            QMetaObject.invokeMethod(self._worker, "flush", Qt.BlockingQueuedConnection)
+
+    def shutdown(self):
+        """Flush and stop the worker thread."""
+        self.flush()
+        self._thread.quit()
+        self._thread.wait()
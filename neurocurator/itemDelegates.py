@@ -8,19 +8,16 @@ from PyQt5.QtWidgets import (QItemDelegate, QPushButton, QCheckBox,
                              QStyledItemDelegate, QLineEdit, QMessageBox,
                              QComboBox)
 
-from nat.modelingParameter import getParameterTypes
 from nat.values import unitIsValid, statisticList
 from .autocomplete import AutoCompleteEdit
-
-
-parameterTypes = getParameterTypes()
+from .resources import parameter_types
 
 
 class ParamTypeCbo(AutoCompleteEdit):
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.setModel([paramType.name for paramType in parameterTypes])
+        self.setModel([paramType.name for paramType in parameter_types.get()])
 
 
 class ButtonDelegate(QItemDelegate):
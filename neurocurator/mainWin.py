@@ -4,14 +4,10 @@ __maintainer__ = "Pierre-Alexandre Fonta"
 import getpass
 import os
 import pickle
-import time
 import webbrowser
-from glob import glob
 from os.path import join
-from threading import Thread
 
-import numpy as np
-from PyQt5.QtCore import QUrl, pyqtSlot, pyqtSignal, QItemSelection, Qt, QModelIndex
+from PyQt5.QtCore import QUrl, pyqtSlot, pyqtSignal, QItemSelection, Qt, QModelIndex, QTimer
 from PyQt5.QtGui import QIcon, QDesktopServices
 from PyQt5.QtWidgets import (QAction, QMainWindow, QLabel, QMessageBox, QDialog,
                              QTabWidget, QSplitter, QWidget, QVBoxLayout,
@@ -22,19 +18,27 @@ from PyQt5.QtWidgets import (QAction, QMainWindow, QLabel, QMessageBox, QDialog,
 from nat.annotation import Annotation
 from nat.gitManager import GitManager, GitMngError
 from nat.id import checkID
-from nat.ontoManager import OntoManager
-from nat.restClient import RESTClient, RESTImportPDFErr
 from nat.tag import Tag
-from nat.utils import Id2FileName  # , fileName2Id
+from nat.utils import Id2FileName, fileName2Id
+from neurocurator.annotation_index import AnnotationCorpusIndex
+from neurocurator.batch_import import BatchImport, BatchImportResult
+from neurocurator.database_watcher import DatabaseWatcher
+from neurocurator.git_worker import GitPipeline
+from neurocurator.ocr_monitor import OCRMonitor
+from neurocurator.paper_session import PaperSession
+from neurocurator.pdf_importer import ImportRESTClient, PDFImporter
+from neurocurator.paper_status import PaperStatusIndex
+from neurocurator.profiling import profile_phase
+from neurocurator.startup import StartupPipeline
 from neurocurator.utils import package_directory
 from neurocurator.zotero_widget import ZoteroTableWidget
-from requests.exceptions import ConnectionError
 from .addOntoTermDlg import AddOntoTermDlg
 from .annotWidgets import EditAnnotWgt
 from .annotationListModel import AnnotationListModel
 from .autocomplete import AutoCompleteEdit
 from .experimentalPropertyWgt import ExpPropWgt
 from .modParamWidgets import ParamModWgt
+from .ontology import OntologyService
 from .searchInterface import SearchWgt
 from .searchOntoWgt import OntoOnlineSearch
 from .settingsDlg import getSettings, SettingsDlg
@@ -59,7 +63,7 @@ class Window(QMainWindow):
             # Refresh the git manage to ensure that it is representative of
             # the actual settings.
             try:
-                self.gitMng = GitManager(self.settings.config["GIT"])
+                self.gitPipeline.set_git_manager(GitManager(self.settings.config["GIT"]))
             except KeyError:
                 self.popUpSettingsDlg()
 
@@ -69,6 +73,14 @@ class Window(QMainWindow):
         # Annotation curently being displayed, modified, or created
         self.currentAnnotation = None
 
+        # Annotations of the paper being curated (see paperSession).
+        self._paperSession = None
+
+        # Paper ID -> path of the PDF, for the imports of the folder being imported (see importPDFFolder).
+        self.batchImportPaths = {}
+        # BatchImportResult of each PDF of the folder being imported.
+        self.batchImportResults = []
+
         # True when the current annotation has been modified and require saving
         self.needSaving         = False
 
@@ -89,55 +101,168 @@ class Window(QMainWindow):
         # True when the annotationEdt field has been modified BY THE USER
         self.detectAnnotChange     = False
     
-        # Load the ontological trees (pre-save for efficiency)
-        self.builtOntoTrees()
-
-        # Load the tag suggester (based on saved tagging history)
-        self.tagSuggester = TagSuggester.load()
+        # The independent loadings are done in worker threads while the window
+        # is shown. The widgets needing them are enabled when they are done.
+        # NB: They are started once the widgets are set up.
+        self.startup = StartupPipeline(parent=self)
+
+        # The ontological trees (pre-save for efficiency)
+        self.ontology = OntologyService.instance().acquire(self)
+        self.ontology.changed.connect(self.ontologyChanged)
+        self.isOntologyLoaded = False
+
+        # The tag suggester (based on saved tagging history)
+        self.tagSuggester = None
+        # The tagging history is saved after a burst of tagging.
+        self.tagSuggesterSaveTimer = QTimer(self)
+        self.tagSuggesterSaveTimer.setSingleShot(True)
+        self.tagSuggesterSaveTimer.setInterval(5 * 1000)
 
         # Load saved settings
-        self.settings = getSettings()
+        with profile_phase("Settings"):
+            self.settings = getSettings()
         if self.settings is None:
             self.close()
             self.deleteLater()
             return
 
         # Load the object used to transparently interact with GIT to save annotations
-        # using versioning.
-        def getGitMng(cleanDirty=False):
-            try:
-                self.gitMng = GitManager(self.settings.config["GIT"], cleanDirty)
-            except KeyError:
-                self.popUpSettingsDlg()
-            except GitMngError as e:
-                msgBox = QMessageBox()
-                msgBox.setStandardButtons(QMessageBox.Cancel)
-                msgBox.setWindowTitle("GIT repository is dirty")
-                msgBox.setText(str(e))
-                button = msgBox.addButton("commit", QMessageBox.YesRole)
-                msgBox.setDefaultButton(button)
-                msgBox.exec_()
-                if msgBox.clickedButton() == button:
-                    getGitMng(cleanDirty=True)
-                else:
-                    raise
-        getGitMng()
+        # using versioning. Commits and pushes are done in a background thread.
+        self.gitPipeline = GitPipeline(parent=self)
+        self.gitPipeline.pushStarted.connect(self.pushStarted)
+        self.gitPipeline.pushProgress.connect(self.pushProgress)
+        self.gitPipeline.pushFinished.connect(self.pushFinished)
+        self.gitPipeline.failed.connect(self.gitFailed)
 
         # Setup the REST client
         try:
-            self.restClient = RESTClient(self.settings.config["REST"]["serverURL"])
+            self.restClient = ImportRESTClient(self.settings.config["REST"]["serverURL"])
         except KeyError:
             self.popUpSettingsDlg()
 
+        # Wait for the OCR of the imported PDFs, including the ones imported before a restart.
+        # NB: The REST client is looked up at each check, in the thread of the monitor.
+        self.ocrMonitor = OCRMonitor(lambda paperId, dbPath: self.restClient.checkOCRFinished(paperId, dbPath),
+                                     parent=self)
+        self.ocrMonitor.ocrFinished.connect(self.ocrFinished)
+        self.ocrMonitor.ocrFailed.connect(self.ocrFailed)
+        self.ocrMonitor.ocrTimedOut.connect(self.ocrTimedOut)
+        self.ocrMonitor.pendingChanged.connect(self.ocrPendingChanged)
+
+        # Import the PDFs in background threads, a few at the same time.
+        self.pdfImporter = PDFImporter(lambda *args: self.restClient.importPDF(*args),
+                                       BatchImport.MAX_WORKERS, self)
+        self.pdfImporter.importStarted.connect(self.pdfImportStarted)
+        self.pdfImporter.importProgress.connect(self.pdfImportProgress)
+        self.pdfImporter.imported.connect(self.pdfImported)
+        self.pdfImporter.ocrNeeded.connect(self.pdfImportNeedsOCR)
+        self.pdfImporter.importFailed.connect(self.pdfImportFailed)
+        self.pdfImporter.importCancelled.connect(self.pdfImportCancelled)
+
         # Load from config the path where the GIT database is located.
         self.dbPath   = os.path.abspath(os.path.expanduser(self.settings.config["GIT"]["local"]))
 
-        self.setupWindowsUI()
-        # Must be called after the creation of the widgets to connect to their slots.
-        self.setupMenus()
+        # Summaries of the annotation files, to be updated when they are written.
+        self.corpusIndex = AnnotationCorpusIndex.for_path(self.dbPath)
+        # Files of each paper, to be updated when they are written.
+        self.paperStatus = PaperStatusIndex.for_path(self.dbPath)
+
+        # Notify the changes of the files of the database done by other programs (git pull, ...).
+        self.databaseWatcher = DatabaseWatcher(self)
+        self.databaseWatcher.filesChanged.connect(self.databaseFilesChanged)
+        with profile_phase("Database watcher"):
+            self.databaseWatcher.watch(self.dbPath)
+
+        with profile_phase("UI construction"):
+            self.setupWindowsUI()
+            # Must be called after the creation of the widgets to connect to their slots.
+            self.setupMenus()
+
+        # Widgets enabled when their data are loaded.
+        self.tagAnnotGroupBox.setDisabled(True)
+        self.zotero_widget.loading_started()
+        self.zotero_menu.setDisabled(True)
+        self.startup.phaseFailed.connect(self.startupPhaseFailed)
+        self.startup.finished.connect(self.startupFinished)
+        self.startup.start("Ontology", self.ontology.load, self.ontologyLoaded)
+        self.startup.start("Tag suggester", TagSuggester.load, self.tagSuggesterLoaded)
+        self.startGitLoading()
+        self.startup.start("Zotero", self.zotero_widget.load_data, self.zoteroLoaded)
+        self.statusBar().showMessage("Loading...")
+        self.ocrMonitor.restore()
 
         self.firstShow = True
 
+    # Startup section. Callbacks of the loadings done in worker threads.
+
+    def startGitLoading(self, cleanDirty=False):
+        try:
+            gitSettings = self.settings.config["GIT"]
+        except KeyError:
+            self.popUpSettingsDlg()
+            return
+        self.startup.start("Git", lambda: GitManager(gitSettings, cleanDirty),
+                           self.gitManagerLoaded, self.gitManagerLoadingFailed)
+
+    def gitManagerLoaded(self, gitManager):
+        self.gitPipeline.set_git_manager(gitManager)
+
+    def gitManagerLoadingFailed(self, exception):
+        if isinstance(exception, KeyError):
+            # NB: Settings of the Git repository missing.
+            self.popUpSettingsDlg()
+        elif isinstance(exception, GitMngError):
+            msgBox = QMessageBox(self)
+            msgBox.setStandardButtons(QMessageBox.Cancel)
+            msgBox.setWindowTitle("GIT repository is dirty")
+            msgBox.setText(str(exception))
+            button = msgBox.addButton("commit", QMessageBox.YesRole)
+            msgBox.setDefaultButton(button)
+            msgBox.exec_()
+            if msgBox.clickedButton() == button:
+                self.startGitLoading(cleanDirty=True)
+            else:
+                # NB: The annotations can't be saved without the repository.
+                self.close()
+        else:
+            errorMessage(self, "Error", "The GIT repository could not be loaded: " + str(exception))
+
+    def ontologyLoaded(self, result=None):
+        self.isOntologyLoaded = True
+        self.builtOntoTrees()
+        self.taggingDataLoaded()
+
+    def tagSuggesterLoaded(self, tagSuggester):
+        self.tagSuggester = tagSuggester
+        self.tagSuggesterSaveTimer.timeout.connect(self.tagSuggester.save)
+        self.taggingDataLoaded()
+
+    def taggingDataLoaded(self):
+        if self.isOntologyLoaded and self.tagSuggester is not None:
+            self.updateAutoCompleteTagList()
+            self.refreshSuggestedTagList()
+            self.tagAnnotGroupBox.setEnabled(True)
+
+    def zoteroLoaded(self, data):
+        self.zotero_widget.data_loaded(data)
+        self.zotero_menu.setEnabled(True)
+
+    @pyqtSlot(str, object)
+    def startupPhaseFailed(self, name, exception):
+        errorMessage(self, "Error", "Loading failed (" + name + "): " + str(exception))
+
+    @pyqtSlot()
+    def startupFinished(self):
+        self.statusBar().showMessage("Loaded.", 5 * 1000)
+
+    @property
+    def paperSession(self):
+        """Session of the paper selected in IdTxt."""
+        paperId = self.IdTxt.text()
+        if self._paperSession is None or not self._paperSession.is_for(self.dbPath, paperId):
+            self._paperSession = PaperSession(self.dbPath, paperId)
+        return self._paperSession
+
     @property
     def needSaving(self):
         return self.__needSaving
@@ -214,6 +339,22 @@ class Window(QMainWindow):
             if msgBox.exec_() == QMessageBox.Yes:
                 self.pushToServer()
 
+        # NB: Waits for the queued commits and the requested push.
+        self.gitPipeline.shutdown()
+        # NB: The loadings still running are not waited for.
+        self.startup.shutdown(wait=False)
+        # NB: The papers waiting for their OCR are saved, they are checked again at the next start.
+        self.ocrMonitor.shutdown()
+        # NB: The upload running is stopped, its PDF is not imported.
+        self.pdfImporter.shutdown()
+        # NB: A refresh stops after its current request. The changes stored are applied by the next one.
+        self.zotero_widget.cancel_refresh()
+        self.zotero_widget.refresh_thread.wait()
+        self.corpusIndex.save()
+        self.tagSuggesterSaveTimer.stop()
+        if self.tagSuggester is not None:
+            self.tagSuggester.save()
+
         event.accept()
 
 
@@ -312,6 +453,18 @@ class Window(QMainWindow):
         commandMenu.addAction(addToOntologyAction)
         commandMenu.addAction(addModParamTypeAction)
 
+        importPDFFolderAction = QAction(QIcon(), '&Import the PDFs of a folder', self)
+        importPDFFolderAction.setStatusTip('Import the PDFs of a folder for the Zotero references they belong to')
+        importPDFFolderAction.triggered.connect(self.importPDFFolder)
+        commandMenu.addAction(importPDFFolderAction)
+
+        cancelPDFImportsAction = QAction(QIcon(), '&Cancel the PDF imports', self)
+        cancelPDFImportsAction.setStatusTip('Cancel the imports of PDFs queued or running')
+        cancelPDFImportsAction.triggered.connect(self.pdfImporter.cancel)
+        cancelPDFImportsAction.setDisabled(True)
+        self.pdfImporter.queueChanged.connect(lambda count: cancelPDFImportsAction.setEnabled(count > 0))
+        commandMenu.addAction(cancelPDFImportsAction)
+
         # Zotero menu section.
 
         refresh_zotero_action = QAction("Refresh database", self)
@@ -326,20 +479,51 @@ class Window(QMainWindow):
         edit_zotero_action.setStatusTip('Edit selected Zotero reference')
         edit_zotero_action.triggered.connect(self.zotero_widget.edit_reference)
 
+        self.cancel_zotero_refresh_action = QAction("Cancel refresh", self)
+        self.cancel_zotero_refresh_action.setStatusTip("Stop the refresh of the Zotero database")
+        self.cancel_zotero_refresh_action.triggered.connect(self.zotero_widget.cancel_refresh)
+        self.cancel_zotero_refresh_action.setEnabled(False)
+
         self.zotero_menu = menu_bar.addMenu("Zotero")
         self.zotero_menu.addAction(refresh_zotero_action)
         self.zotero_menu.addAction(add_zotero_action)
         self.zotero_menu.addAction(edit_zotero_action)
+        self.zotero_menu.addAction(self.cancel_zotero_refresh_action)
+        # Actions disabled while the Zotero database is refreshed.
+        self.zotero_edition_actions = [refresh_zotero_action, add_zotero_action, edit_zotero_action]
+
+    def set_zotero_refreshing(self, is_refreshing):
+        for action in self.zotero_edition_actions:
+            action.setDisabled(is_refreshing)
+        self.cancel_zotero_refresh_action.setEnabled(is_refreshing)
 
     @pyqtSlot()
     def zotero_refresh_started(self):
-        self.zotero_menu.setDisabled(True)
+        self.set_zotero_refreshing(True)
         self.statusBar().showMessage("Refreshing the Zotero database...")
 
+    @pyqtSlot(int, int, str)
+    def zotero_refresh_progress(self, count, maxCount, message):
+        if count:
+            message += " ({})".format(count)
+        self.statusBar().showMessage(message)
+
+    @pyqtSlot(int)
+    def zotero_refresh_finished(self, change_count):
+        self.set_zotero_refreshing(False)
+        message = "The Zotero database has been refreshed ({} references changed)."
+        self.statusBar().showMessage(message.format(change_count), 10 * 1000)
+
+    @pyqtSlot(str)
+    def zotero_refresh_failed(self, message):
+        self.set_zotero_refreshing(False)
+        self.statusBar().showMessage("Zotero can't be reached, the local references are used: "
+                                     + message, 10 * 1000)
+
     @pyqtSlot()
-    def zotero_refresh_finished(self):
-        self.zotero_menu.setEnabled(True)
-        self.statusBar().showMessage("The Zotero database has been refreshed.", 10 * 1000)
+    def zotero_refresh_cancelled(self):
+        self.set_zotero_refreshing(False)
+        self.statusBar().showMessage("The refresh of the Zotero database has been cancelled.", 10 * 1000)
 
     def addToOntology(self):
         addToOntoDlg = AddOntoTermDlg(self)
@@ -352,9 +536,8 @@ class Window(QMainWindow):
 
 
     def refreshLocalOnto(self):
+        # The auto-completion lists are refreshed by ontologyChanged().
         self.builtOntoTrees(recompute=True)
-        #TODO: Need to refresh auto-completion lists if we want it to take
-        # this refreshed ontology into account without restarting the app.
 
     def setupWindowsUI(self) :
         self.setupPaperGB()
@@ -373,7 +556,8 @@ class Window(QMainWindow):
         directory = package_directory()
 
         # NB: Don't specify a parent for widgets to be added to a QTabWidget.
-        self.zotero_widget = ZoteroTableWidget(zotero_settings, directory, self.checkIdInDB, self.dbPath, self)
+        with profile_phase("Zotero"):
+            self.zotero_widget = ZoteroTableWidget(zotero_settings, directory, self.checkIdInDB, self.dbPath, self)
 
         self.zotero_widget.view.doubleClicked.connect(self.changeTagToAnnotations)
 
@@ -385,7 +569,10 @@ class Window(QMainWindow):
         selection_model.selectionChanged.connect(self.paperSelectionChanged)
 
         self.zotero_widget.refresh_thread.started.connect(self.zotero_refresh_started)
-        self.zotero_widget.refresh_thread.finished.connect(self.zotero_refresh_finished)
+        self.zotero_widget.refreshed.connect(self.zotero_refresh_finished)
+        self.zotero_widget.refreshFailed.connect(self.zotero_refresh_failed)
+        self.zotero_widget.refreshCancelled.connect(self.zotero_refresh_cancelled)
+        self.zotero_widget.refreshProgress.connect(self.zotero_refresh_progress)
 
         self.mainTabs.addTab(self.zotero_widget, "References (Zotero)")
 
@@ -530,7 +717,7 @@ class Window(QMainWindow):
         self.tagEdit = AutoCompleteEdit(self)
         self.tagEdit.setMinimumWidth(10)
 
-        self.updateAutoCompleteTagList()
+        # NB: The auto-completion list is set when the ontology is loaded.
 
         # List tags that have been selected by the user
         self.selectedTagsWidget = QListWidget(self)
@@ -575,25 +762,12 @@ class Window(QMainWindow):
     def updateAutoCompleteTagList(self):
         # Sort list of suggestions so that more often used tags 
         # are on the top of the autocompletion list
-        ids = list(self.tagSuggester.usedTag.keys())
-        usage = list(self.tagSuggester.usedTag.values())
-        ids.sort(key=dict(zip(ids, usage)).get, reverse=True)
-
-        usedNames = [self.dicData[id] for id in ids if id in self.dicData] 
-
+        nameModel = self.ontology.name_model()
+        for id, count in self.tagSuggester.usedTag.items():
+            if id in self.dicData:
+                nameModel.setUsage(self.dicData[id], count)
 
-        allNames  = np.array(list(self.dicData.values()))
- 
-        # TODO: LINE ADDED TEMPORALLY. TO REMOVE. THERE SHOULD BE NO NONE VALUES
-        #       HERE. ASSERTS HAS BEEN ADDED TO AVOID THIS TO HAPPEN AGAIN.
-        allNames = np.array([name for name in allNames if not name is None])
-
-        assert(not np.any([name is None for name in allNames]))
-
-        # Putting used tag at the top of the list. 
-        allNames = np.concatenate([usedNames, allNames[np.logical_not(np.in1d(allNames, usedNames))]])
-        
-        self.tagEdit.setModel(allNames)
+        self.tagEdit.setSharedModel(nameModel)
     
 
 
@@ -649,8 +823,11 @@ class Window(QMainWindow):
         if settingsDlg.exec_() == QDialog.Accepted:
             self.settings = getSettings()
 
-            self.gitMng = GitManager(self.settings.config["GIT"])
+            self.gitPipeline.set_git_manager(GitManager(self.settings.config["GIT"]))
             self.dbPath   = os.path.abspath(os.path.expanduser(self.settings.config["GIT"]["local"]))
+            self.corpusIndex = AnnotationCorpusIndex.for_path(self.dbPath)
+            self.paperStatus = PaperStatusIndex.for_path(self.dbPath)
+            self.databaseWatcher.watch(self.dbPath)
 
 
 
@@ -718,15 +895,33 @@ class Window(QMainWindow):
         self.needSavingDisabled = False 
 
 
+    @property
+    def treeData(self):
+        # NB: Waits for the ontology if it is still loading.
+        return self.ontology.trees
+
+    @property
+    def dicData(self):
+        # NB: Waits for the ontology if it is still loading.
+        return self.ontology.dics
+
     def builtOntoTrees(self, recompute=False):
-        self.ontoMng = OntoManager(recompute=recompute)
-        self.treeData                  = self.ontoMng.trees 
-        self.dicData                   = self.ontoMng.dics
+        if recompute:
+            # Emits OntologyService.changed.
+            self.ontology.recompute()
         #self.nlTreeModel               = TreeModel(self.treeData)
         #self.nlTreeView                = TreeView(self.nlTreeModel)
         #self.nlTreeView.clicked.connect(self.nlTreeWasClicked)
 
 
+    @pyqtSlot()
+    def ontologyChanged(self):
+        self.builtOntoTrees()
+        if hasattr(self, "tagEdit") and self.tagSuggester is not None:
+            self.updateAutoCompleteTagList()
+
+
+
     #def nlTreeWasClicked(self, selected):
     #    tagId     = selected.data(Qt.UserRole)
     #    self.addTagToAnnotation(tagId)
@@ -741,9 +936,11 @@ class Window(QMainWindow):
 
 
     def tagSuggestionSelected(self, name):
-        id = [tagId for tagId, tagName in self.dicData.items() if name == tagName]
-        assert(len(id)==1)
-        id = id[0]
+        try:
+            id = self.ontology.index.id_for_name(name)
+        except KeyError:
+            # The text entered does not correspond to an ontological term.
+            return
         self.addTagToAnnotation(id)
         self.tagEdit.erase = True
         self.tagEdit.clearEditText()
@@ -779,15 +976,16 @@ class Window(QMainWindow):
             if tagName is None:
                 tagName = self.dicData[tagId]                
             else:
-                if not tagName in self.dicData:
-                    self.dicData[tagId] = tagName
-                    self.ontoMng.savePickle()
-                    self.updateAutoCompleteTagList()
+                if not tagId in self.dicData:
+                    # NB: Also adds the term to the shared name model of tagEdit.
+                    self.ontology.add_term(tagId, tagName)
 
             self.currentAnnotation.addTag(tagId, tagName)
             self.needSaving = True
 
             self.tagSuggester.addUsedTag(tagId)
+            self.tagSuggesterSaveTimer.start()
+            self.tagEdit.setUsage(tagName, self.tagSuggester.usedTag[tagId])
             self.refreshTagList()
 
 
@@ -816,12 +1014,9 @@ class Window(QMainWindow):
         
                 # If there is already other annotations associated with this 
                 # paper, ask if the persistence should also be applied to them.
-                fileName = join(self.dbPath, Id2FileName(self.IdTxt.text())) + ".pcr"
-                with open(fileName, "r", encoding="utf-8", errors='ignore') as f:
-                    try:
-                        annotations = Annotation.readIn(f)
-                    except ValueError:
-                        raise ValueError("Problem reading file " + fileName + ". The JSON coding of this file seems corrupted.")
+                paperSession = self.paperSession
+                fileName = paperSession.path
+                annotations = paperSession.annotations()
             
                 isNewAnnot = not self.currentAnnotation in self.annotTableModel.annotationList or self.currentAnnotation is None
                 if len(annotations) > 1 - int(isNewAnnot) :
@@ -837,25 +1032,21 @@ class Window(QMainWindow):
                         # Save unsaved modifications if there are any...
                         if self.needSaving:
                             self.saveAnnotation()
-                            with open(fileName, "r", encoding="utf-8", errors='ignore') as f:
-                                try:
-                                    annotations = Annotation.readIn(f)
-                                except ValueError:
-                                    raise ValueError("Problem reading file " + fileName + ". The JSON coding of this file seems corrupted.")
+                            annotations = paperSession.annotations()
 
-                        commit = False
+                        modifiedAnnotations = []
                         for annot in annotations:
                             if not tag.id in [annotTag.id for annotTag in annot.tags]:
                                 annot.addTag(tag.id, tag.name)
-                                commit = True
+                                modifiedAnnotations.append(annot)
 
-                        if commit:
+                        if modifiedAnnotations:
                             # TODO: Should be in a try block and if it generate an exception
                             # we should role back to last git version.
-                            with open(fileName, "w", encoding="utf-8", errors='ignore') as f:
-                                Annotation.dump(f, annotations)
+                            paperSession.save_all(modifiedAnnotations)
 
-                            self.gitMng.addFiles([fileName])
+                            self.paperFileWritten(fileName)
+                            self.gitPipeline.add_files([fileName])
                             self.refreshListAnnotation()
 
             self.savePersistTag()
@@ -883,6 +1074,8 @@ class Window(QMainWindow):
                 self.currentAnnotation.removeTag(tag.id)
                 self.needSaving = True
                 self.tagSuggester.removeUsedTag(tag.id)
+                self.tagSuggesterSaveTimer.start()
+                self.tagEdit.setUsage(tag.name, self.tagSuggester.usedTag.get(tag.id, 0))
         self.refreshTagList()
 
 
@@ -901,10 +1094,9 @@ class Window(QMainWindow):
             msgBox.setStandardButtons(QMessageBox.No | QMessageBox.Yes)
             msgBox.setDefaultButton(QMessageBox.Yes)
             if msgBox.exec_() == QMessageBox.Yes:
-                if not self.importPDF():
-                    return
-            else:
-                return
+                # NB: The import is asynchronous, the PDF can be opened once it is finished.
+                self.importPDF()
+            return
 
         QDesktopServices.openUrl(QUrl.fromLocalFile(pdf_path))
 
@@ -987,17 +1179,11 @@ class Window(QMainWindow):
                     retCode = msgBox.exec_()
 
                     if retCode == 0:
-                        try:
-                            if not self.importPDF():
-                                self.invalidPaperChoice()
-                                return
-                        except UnicodeEncodeError:
-                            errorMessage(self, "Unicode error", "Please check that " +\
-                                         "the path of the file you are trying to " +\
-                                         "upload does not contain non ASCII " +\
-                                         "characters. Complete support of unicode " +\
-                                         "encoding for file names and paths are " +\
-                                         "not provided.")
+                        # NB: The import is asynchronous. The paper is selected
+                        # again when it is finished, see pdfImported().
+                        self.importPDF()
+                        self.invalidPaperChoice()
+                        return
 
                     elif retCode == 1 and isDOI:
                         url = "http://dx.doi.org/" + self.IdTxt.text()
@@ -1010,7 +1196,9 @@ class Window(QMainWindow):
                 elif isUNPUBLISHED:
                     saveFileName = join(self.dbPath, Id2FileName(self.IdTxt.text()))
                     with open(saveFileName + ".pcr", 'w', encoding="utf-8", errors='ignore'):
-                        self.gitMng.addFiles([saveFileName + ".pcr"])
+                        pass
+                    self.gitPipeline.add_files([saveFileName + ".pcr"])
+                    self.paperFileWritten(saveFileName + ".pcr")
 
 
             self.openPDFBtn.setDisabled(isUNPUBLISHED)
@@ -1049,9 +1237,9 @@ class Window(QMainWindow):
     def refreshSuggestedTagList(self):
         # Suggested tag list
         self.suggestedTagsWidget.clear()
-        if not self.currentAnnotation is None:
-            annotationFileName = join(self.dbPath, Id2FileName(self.IdTxt.text())) + ".pcr"
-            tagIds = self.tagSuggester.suggestions(annotationFileName, [tag.id for tag in self.getSelectedTags()], 200)
+        # NB: The tag suggester is loaded in a worker thread at the startup.
+        if not self.currentAnnotation is None and self.tagSuggester is not None:
+            tagIds = self.tagSuggester.suggestions(self.paperSession.tag_counts(), [tag.id for tag in self.getSelectedTags()], 200)
 
             unusedPersistedSuggestedTags = []
             selectedTags                 = [tag.id for tag in self.getSelectedTags()] 
@@ -1070,28 +1258,43 @@ class Window(QMainWindow):
         self.IdTxt.setText("")
 
         
-    def waitForOCR(self, paperId, notify):
-        
-        while(not self.restClient.checkOCRFinished(paperId, self.dbPath)):
-            self.statusBar().showMessage("Performing OCR...")
-            time.sleep(5)          
-        
-        self.statusBar().showMessage("OCR finished.", 10*1000)
-        if notify == QMessageBox.Yes:
-            msgBox = QMessageBox()
+    @pyqtSlot(str, str, bool)
+    def ocrFinished(self, paperId, dbPath, notify):
+        self.createPaperRecord(paperId, dbPath)
+        self.statusBar().showMessage("OCR finished for the paper " + paperId + ".", 10*1000)
+        if notify:
+            msgBox = QMessageBox(self)
             msgBox.setStandardButtons(QMessageBox.Cancel)
             msgBox.setWindowTitle("OCR process finished")
             msgBox.setText("The optical character recognition for the paper " + paperId
                            + " is finished. You can now start annotating this paper.")
             msgBox.exec_()
 
+    @pyqtSlot(str, str)
+    def ocrFailed(self, paperId, message):
+        errorMessage(self, "OCR error", "The optical character recognition for the paper "
+                     + paperId + " failed. Error message: " + message)
+
+    @pyqtSlot(str)
+    def ocrTimedOut(self, paperId):
+        errorMessage(self, "OCR error", "The optical character recognition for the paper "
+                     + paperId + " is still not finished. It is not waited for anymore."
+                     + " Please import its PDF again later.")
+
+    @pyqtSlot(int)
+    def ocrPendingChanged(self, count):
+        # NB: The end of an OCR is reported by the other slots.
+        if count:
+            self.statusBar().showMessage("Performing OCR for {} paper(s)...".format(count))
+
 
     def importPDF(self):
-        # Import a PDF
+        # Queue the import of a PDF for the current paper. The result is
+        # reported to pdfImported(), pdfImportNeedsOCR() or pdfImportFailed().
 
         if not checkID(self.IdTxt.text()):
             errorMessage(self, "Error", "This ID seem to be invalid.")
-            return
+            return False
 
         fileName, _ = QFileDialog.getOpenFileName(self, 'Open file')
         fileName    = fileName.encode("utf-8").decode("utf-8")
@@ -1100,38 +1303,166 @@ class Window(QMainWindow):
             if os.path.isfile(saveFileName + ".txt"):
                 errorMessage(self, "Error", "This PDF has already been imported to the database.")
 
-            try:
-                self.restClient.importPDF(fileName, self.IdTxt.text(), self.dbPath)
-                
-            except ConnectionError as e:
-                errorMessage(self, "Error", "Failed to connect to the REST server. Error message: " + str(e))                                
-                return False
-                
-            except RESTImportPDFErr as e:
-                msgBox = QMessageBox(self)
-                msgBox.setWindowTitle("This PDF needs OCR")
-                msgBox.setText(str(e) + " Do you want to be notifed when this process is done?")
-                msgBox.setStandardButtons(QMessageBox.No | QMessageBox.Yes)
-                msgBox.setDefaultButton(QMessageBox.Yes)
-                
-                thread = Thread(target = self.waitForOCR, 
-                                args = (self.IdTxt.text(), msgBox.exec_(), ))
-                thread.start()  
+            if not self.pdfImporter.enqueue(self.IdTxt.text(), fileName, self.dbPath):
+                errorMessage(self, "Error", "The PDF of this paper is already being imported.")
                 return False
-
-            pcr_path = saveFileName + ".pcr"
-            if not os.path.isfile(pcr_path):
-                with open(pcr_path, "w", encoding="utf-8", errors="ignore"):
-                    self.gitMng.addFiles([pcr_path])
-
             return True
 
         return False
 
+    def createPaperRecord(self, paperId, dbPath):
+        """Create the annotation file of the paper, if it has none, once its PDF has been imported."""
+        if dbPath != self.dbPath:
+            # NB: The database has been changed in the preferences meanwhile.
+            return
+        pcr_path = join(dbPath, Id2FileName(paperId)) + ".pcr"
+        if not os.path.isfile(pcr_path):
+            with open(pcr_path, "w", encoding="utf-8", errors="ignore"):
+                pass
+            self.gitPipeline.add_files([pcr_path])
+        # NB: The PDF and its text have been written by the REST server.
+        self.paperFileWritten(pcr_path)
+
+    @pyqtSlot(str)
+    def pdfImportStarted(self, paperId):
+        self.statusBar().showMessage("Importing the PDF of " + paperId + "...")
+
+    @pyqtSlot(int, int, str)
+    def pdfImportProgress(self, count, maxCount, message):
+        if maxCount:
+            message += " ({}%)".format(count * 100 // maxCount)
+        self.statusBar().showMessage(message)
+
+    def importPDFFolder(self):
+        # Import the PDFs of a folder, matched to the Zotero references by
+        # the DOI or the PMID in their file name or their metadata.
+        if self.batchImportPaths:
+            errorMessage(self, "Error", "The PDFs of a folder are already being imported.")
+            return
+
+        referenceIds = self.zotero_widget.reference_ids()
+        if not referenceIds:
+            errorMessage(self, "Error", "The Zotero references are not loaded yet.")
+            return
+
+        folder = QFileDialog.getExistingDirectory(self, 'Folder of PDFs')
+        if folder == '':
+            return
+
+        batchImport = BatchImport(folder, referenceIds, self.dbPath)
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            toImport, self.batchImportResults = batchImport.match()
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        for path, paperId in toImport:
+            if self.pdfImporter.enqueue(paperId, path, self.dbPath):
+                self.batchImportPaths[paperId] = path
+            else:
+                self.batchImportResults.append(BatchImportResult(path, paperId, BatchImport.FAILED,
+                                                                 "The PDF of this paper is already being imported."))
+        if not self.batchImportPaths:
+            self.reportBatchImport()
+
+    def batchImportDone(self, paperId, status, message=""):
+        """Record the result of the import if it is part of the folder being imported.
+
+        Return True if it is.
+        """
+        path = self.batchImportPaths.pop(paperId, None)
+        if path is None:
+            return False
+        self.batchImportResults.append(BatchImportResult(path, paperId, status, message))
+        if not self.batchImportPaths:
+            self.reportBatchImport()
+        return True
+
+    def reportBatchImport(self):
+        results = sorted(self.batchImportResults, key=lambda result: result.path)
+        self.batchImportResults = []
+
+        counts = {}
+        for result in results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+        details = []
+        for result in results:
+            line = os.path.basename(result.path) + ": " + result.status
+            if result.paper_id:
+                line += " (" + result.paper_id + ")"
+            if result.message:
+                line += ". " + result.message
+            details.append(line)
+
+        msgBox = QMessageBox(self)
+        msgBox.setWindowTitle("Import of the PDFs of a folder")
+        msgBox.setText("{} PDF(s) processed.\n".format(len(results)) +
+                       "\n".join("{}: {}".format(status, count) for status, count in sorted(counts.items())))
+        msgBox.setDetailedText("\n".join(details))
+        msgBox.setStandardButtons(QMessageBox.Ok)
+        msgBox.exec_()
+
+    @pyqtSlot(str, str)
+    def pdfImported(self, paperId, dbPath):
+        self.createPaperRecord(paperId, dbPath)
+        self.statusBar().showMessage("The PDF of " + paperId + " has been imported.", 10*1000)
+        if self.batchImportDone(paperId, BatchImport.IMPORTED):
+            return
+
+        # Select again the paper if it is still selected in the Zotero table.
+        if not self.IdTxt.text():
+            selection = self.zotero_widget.view.selectionModel().selection()
+            indexes = selection.indexes()
+            if indexes and indexes[0].model().data(indexes[0].model().index(indexes[0].row(), 0)) == paperId:
+                self.paperSelectionChanged(selection, QItemSelection())
+
+    @pyqtSlot(str, str, str)
+    def pdfImportNeedsOCR(self, paperId, dbPath, message):
+        if self.batchImportDone(paperId, BatchImport.OCR_NEEDED):
+            # NB: The end of the OCR is reported in the status bar.
+            self.ocrMonitor.add(paperId, dbPath)
+            return
+
+        msgBox = QMessageBox(self)
+        msgBox.setWindowTitle("This PDF needs OCR")
+        msgBox.setText(message + " Do you want to be notifed when this process is done?")
+        msgBox.setStandardButtons(QMessageBox.No | QMessageBox.Yes)
+        msgBox.setDefaultButton(QMessageBox.Yes)
+
+        notify = msgBox.exec_() == QMessageBox.Yes
+        self.ocrMonitor.add(paperId, dbPath, notify)
+
+    @pyqtSlot(str, str)
+    def pdfImportFailed(self, paperId, message):
+        if self.batchImportDone(paperId, BatchImport.FAILED, message):
+            return
+        errorMessage(self, "Error", "The import of the PDF of " + paperId
+                     + " failed. Error message: " + message)
+
+    @pyqtSlot(str)
+    def pdfImportCancelled(self, paperId):
+        self.batchImportDone(paperId, BatchImport.CANCELLED)
+        self.statusBar().showMessage("The import of the PDF of " + paperId + " has been cancelled.", 10*1000)
+
 
 
     def pushToServer(self):
-        info = self.gitMng.push()
+        # NB: The result is reported to pushFinished().
+        self.gitPipeline.push()
+
+    @pyqtSlot()
+    def pushStarted(self):
+        self.statusBar().showMessage("Pushing the annotations to the server...")
+
+    @pyqtSlot(int, int, str)
+    def pushProgress(self, count, maxCount, message):
+        if maxCount:
+            self.statusBar().showMessage("Pushing the annotations to the server... {}% {}"
+                                         .format(int(100*count/maxCount), message.strip()))
+
+    @pyqtSlot(object)
+    def pushFinished(self, info):
+        self.statusBar().clearMessage()
         if info is None:
                         msgBox = QMessageBox(self)
                         msgBox.setWindowTitle("Push error")
@@ -1146,13 +1477,13 @@ class Window(QMainWindow):
             msgBox.setStandardButtons(QMessageBox.Ok)
             msgBox.exec_()
         else:
-            msgBox = QMessageBox(self)
-            msgBox.setWindowTitle("Repository pushed to the server")
-            msgBox.setText("Modifications has been successfully pushed to the server.")
-            msgBox.setStandardButtons(QMessageBox.Ok)
-            msgBox.exec_()
+            self.statusBar().showMessage("Modifications has been successfully pushed to the server.", 10*1000)
+            self.needPush = False
 
-        self.needPush = False
+    @pyqtSlot(str)
+    def gitFailed(self, message):
+        self.statusBar().clearMessage()
+        errorMessage(self, "GIT error", message)
 
 
 
@@ -1170,15 +1501,17 @@ class Window(QMainWindow):
 
 
     def deleteAnnotation(self):
+        annotationId = self.currentAnnotation.ID
         self.annotTableModel.annotationList.remove(self.currentAnnotation)
         self.currentAnnotation = None
 
-        fileName = join(self.dbPath, Id2FileName(self.IdTxt.text())) + ".pcr"
-        with open(fileName, "w", encoding="utf-8", errors='ignore') as f:
-            Annotation.dump(f, self.annotTableModel.annotationList)
+        fileName = self.paperSession.path
+        # NB: The annotation might not have been saved yet.
+        self.paperSession.delete(annotationId)
 
+        self.paperFileWritten(fileName)
         self.clearAddAnnotation()
-        self.gitMng.addFiles([fileName])
+        self.gitPipeline.add_files([fileName])
         self.needPush = True
         self.needSaving = False
         self.detectAnnotChange = False
@@ -1190,14 +1523,8 @@ class Window(QMainWindow):
     def saveAnnotation(self):
 
         self.editAnnotSubWgt.updateCurrentAnnotation()
-        fileName = join(self.dbPath, Id2FileName(self.IdTxt.text())) + ".pcr"
+        fileName = self.paperSession.path
 
-        with open(fileName, "r", encoding="utf-8", errors='ignore') as f:
-            try:
-                annots = Annotation.readIn(f)
-            except ValueError:
-                raise ValueError("Problem reading file " + fileName + ". The JSON coding of this file seems corrupted.")
-            
         # Existing annotation has been modified
         if self.currentAnnotation is None:
             return
@@ -1208,24 +1535,18 @@ class Window(QMainWindow):
         self.currentAnnotation.experimentProperties = self.expPropWgt.getExpProperties()
 
         if self.currentAnnotation in self.annotTableModel.annotationList:
-            for i, annot in enumerate(annots):
-                if self.currentAnnotation.ID == annot.ID:
-                    annots[i] = self.currentAnnotation
-                    break
             row = None
 
-
         # New annotation has been created
         else:
-            annots.append(self.currentAnnotation)
-
             # Select the new (last) annotation
             row = -1
 
-        with open(fileName, "w", encoding="utf-8", errors='ignore') as f:
-            Annotation.dump(f, annots)
+        # NB: Replaces the annotation with the same ID, or appends it.
+        self.paperSession.save(self.currentAnnotation)
 
-        self.gitMng.addFiles([fileName])
+        self.paperFileWritten(fileName)
+        self.gitPipeline.add_files([fileName])
         self.needPush = True
         self.detectAnnotChange = False
         self.needSaving = False
@@ -1272,19 +1593,42 @@ class Window(QMainWindow):
         #self.refreshModelingParam()
         return True
 
+    def paperFileWritten(self, fileName):
+        """Update the data derived from the files of the paper after one of them has been written."""
+        self.corpusIndex.update_file(fileName)
+        paperId = fileName2Id(os.path.splitext(os.path.basename(fileName))[0])
+        # NB: All the files of the paper, the PDF and the text can be written by the REST server.
+        self.paperStatus.update_paper(paperId)
+        self.zotero_widget.update_papers([paperId])
+
+    @pyqtSlot(list)
+    def databaseFilesChanged(self, fileNames):
+        """Update the data derived from the files of the papers which have been changed.
+
+        Changes done by the application are reported too. Updating again
+        their data is cheap: the files are read again only if they differ
+        from the data in memory.
+        """
+        paperIds = set()
+        for fileName in fileNames:
+            if fileName.endswith(".pcr"):
+                self.corpusIndex.update_file(fileName)
+            self.paperStatus.update_file(fileName)
+            paperIds.add(fileName2Id(os.path.splitext(os.path.basename(fileName))[0]))
+        self.corpusIndex.save()
+        self.zotero_widget.update_papers(paperIds)
+
+        # NB: The annotations being edited are not discarded.
+        if (self.IdTxt.text() in paperIds and not self.needSaving
+                and not self.paperSession.is_up_to_date()):
+            self.refreshListAnnotation()
+
     def checkIdInDB(self, ID):
-        # FIXME Delayed refactoring.
-        papersPCR = glob(join(self.dbPath, Id2FileName(ID) + ".pcr")) # paper curation record
-        papersPDF = glob(join(self.dbPath, Id2FileName(ID) + ".pdf")) # paper curation record
-        papersTXT = glob(join(self.dbPath, Id2FileName(ID) + ".txt")) # paper curation record
-        
-        if len(papersPCR) == 0:
-            return 0 # There is no record yet for this paper.
-            
-        if len(papersPDF) == 0 or len(papersTXT) == 0:
-            return 1 # We have a record, but not pdf or txt.
-            
-        return 2 # We have a record, a txt and a pdf.
+        # 0: There is no record yet for this paper.
+        # 1: We have a record, but not pdf or txt.
+        # 2: We have a record, a txt and a pdf.
+        # NB: Looked up in the index, without access to the file system.
+        return self.paperStatus.status(ID)
 
 
     def clearAddAnnotation(self):
@@ -1300,8 +1644,7 @@ class Window(QMainWindow):
 
         self.annotTableModel.annotationList = []
         try :
-            with open(join(self.dbPath, Id2FileName(self.IdTxt.text()) + ".pcr"), 'r', encoding="utf-8", errors='ignore') as f:        
-                self.annotTableModel.annotationList = Annotation.readIn(f)    
+            self.annotTableModel.annotationList = self.paperSession.annotations()
 
             if not row is None:
                 if row < 0:
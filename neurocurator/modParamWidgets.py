@@ -11,10 +11,10 @@ from PyQt5.QtWidgets import (QMessageBox, QGridLayout, QAbstractItemView,
 from nat.modelingParameter import (getParameterTypeFromName,
                                    getParameterTypeNameFromID,
                                    getParameterTypeFromID)
-from nat.ontoManager import OntoManager
 from nat.tag import RequiredTag
 from nat.tagUtilities import nlx2ks
 from .itemDelegates import ReqTagDelegate
+from .ontology import OntologyService
 from .paramFunctionWgt import ParamFunctionWgt
 from .paramRelationWgt import ParamRelationWgt
 from .paramTraceWgt import ParamTraceWgt
@@ -29,26 +29,22 @@ class RequiredTagsTableView(QTableView):
         super().__init__(parent)
         self.reqTagDelegate = ReqTagDelegate(self)
         self.setItemDelegateForColumn(1, self.reqTagDelegate)
-        ontoMng = OntoManager()
-        self.treeData                  = ontoMng.trees 
-        self.dicData                   = ontoMng.dics
+        self.ontology = OntologyService.instance().acquire(self)
         self.reqTagDelegate.cboNeedPopulation.connect(self.setReqTags)
 
     def setReqTags(self, tagName):
 
         try:
-            tagId = list(self.dicData.keys())[list(self.dicData.values()).index(tagName)]
-        except ValueError:
-            ontoMng       = OntoManager(recompute=True)      
-            self.treeData = ontoMng.trees 
-            self.dicData  = ontoMng.dics    
-            tagId = list(self.dicData.keys())[list(self.dicData.values()).index(tagName)]
+            tagId = self.ontology.index.id_for_name(tagName)
+        except KeyError:
+            self.ontology.recompute()
+            tagId = self.ontology.index.id_for_name(tagName)
             
         
-        if not tagId in self.treeData:
+        if not self.ontology.index.is_root(tagId):
             raise ValueError("The term id " + tagId + " was not specified as an ontological root.")
 
-        self.reqTagDelegate.addItems(list(self.treeData[tagId].values()))
+        self.reqTagDelegate.addItems(list(self.ontology.trees[tagId].values()))
 
 
 
@@ -63,9 +59,7 @@ class RequiredTagsListModel(QAbstractTableModel):
         self.requiredTagsNames     = []
         self.selectedTagsIds       = []
         self.selectedTagsNames     = []
-        ontoMng = OntoManager()
-        self.treeData                  = ontoMng.trees 
-        self.dicData                   = ontoMng.dics
+        self.ontology              = OntologyService.instance().acquire(self)
 
 
     def rowCount(self, parent=QModelIndex()):
@@ -95,27 +89,25 @@ class RequiredTagsListModel(QAbstractTableModel):
 
         if index.column() == 0:
             self.requiredTagsNames[index.row()] = value
-            tagId = list(self.dicData.keys())[list(self.dicData.values()).index(value)]            
+            tagId = self.ontology.index.id_for_name(value)
             self.requiredTagsIds[index.row()]   = tagId
             
         elif index.column() == 1:
             if self.checkTagValidity(index.row(), value):
                 self.selectedTagsNames[index.row()] = value
-                tagId = list(self.dicData.keys())[list(self.dicData.values()).index(value)]    
+                tagId = self.ontology.index.id_for_name(value)
                 self.selectedTagsIds[index.row()]   = tagId
 
     def checkTagValidity(self, row, tagName):
 
         tagId = self.requiredTagsIds[row]
 
-        if not tagId in self.treeData:    
-            ontoMng       = OntoManager(recompute=True)      
-            self.treeData = ontoMng.trees 
-            self.dicData  = ontoMng.dics            
-            if not tagId in self.treeData:                
-                raise ValueError("Tag '" + tagId + "' is not a treeData root. TreeData roots are the following:" + str(list(self.treeData.keys())))
+        if not self.ontology.index.is_root(tagId):
+            self.ontology.recompute()
+            if not self.ontology.index.is_root(tagId):
+                raise ValueError("Tag '" + tagId + "' is not a treeData root. TreeData roots are the following:" + str(list(self.ontology.trees.keys())))
 
-        return tagName in list(self.treeData[tagId].values())
+        return tagName in self.ontology.index.subtree_names(tagId)
 
 
     def flags(self, index):
@@ -0,0 +1,153 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from itertools import chain, islice
+
+
+class NameIndex:
+    """Case-insensitive substring search in a list of names, ranked by usage.
+
+    Names are indexed by their trigrams, on the first search needing them.
+    A search looks up the rarest trigram of the searched text, then checks
+    only the names having it. Texts shorter than a trigram are searched in
+    the ranking order, stopping as soon as enough names have been found.
+
+    Ranking: the most used names first, then the other names in their order
+    in the list. Names and numbers of uses are updated incrementally with
+    add() and set_usage().
+    """
+
+    GRAM_LENGTH = 3
+
+    def __init__(self, names, usage=None):
+        """usage gives, for some names, their number of uses."""
+        self._names = list(names)
+        self._lower_names = [name.lower() for name in self._names]
+        # Trigram -> IDs of the names containing it, in increasing order.
+        self._postings = None
+        # Name -> ID. NB: The first ID is kept for names in the list several times.
+        self._ids = {}
+        for name_id, name in enumerate(self._names):
+            self._ids.setdefault(name, name_id)
+        # Name ID -> number of uses, for the used names.
+        self._usage = {}
+        if usage:
+            for name, count in usage.items():
+                if name in self._ids and count > 0:
+                    self._usage[self._ids[name]] = count
+        # Rank keys of the used names, in the ranking order.
+        self._ranked_used_keys = sorted(self._rank_key(name_id) for name_id in self._usage)
+        # IDs of the used names, in increasing order, to rank the other names.
+        self._sorted_used_ids = sorted(self._usage)
+
+    def __len__(self):
+        return len(self._names)
+
+    # Public methods section.
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def names(self):
+        """Return the names, in the ranking order."""
+        return [self._names[name_id] for name_id in self._ranked_ids()]
+
+    def search(self, text, limit):
+        """Return the first limit names containing text, in the ranking order."""
+        text = text.lower()
+        if len(text) < self.GRAM_LENGTH:
+            matches = (name_id for name_id in self._ranked_ids()
+                       if text in self._lower_names[name_id])
+            return [self._names[name_id] for name_id in islice(matches, max(limit, 0))]
+
+        if self._postings is None:
+            self._build_postings()
+        candidates = None
+        for gram in self._grams(text):
+            posting = self._postings.get(gram)
+            if posting is None:
+                return []
+            if candidates is None or len(posting) < len(candidates):
+                candidates = posting
+        matches = [name_id for name_id in candidates if text in self._lower_names[name_id]]
+        return [self._names[name_id] for name_id in heapq.nsmallest(limit, matches, key=self._rank_key)]
+
+    def rank(self, name):
+        """Return the position of the name in the ranking order. Raise KeyError if it is unknown."""
+        name_id = self._ids[name]
+        if name_id in self._usage:
+            return bisect_left(self._ranked_used_keys, self._rank_key(name_id))
+        # NB: The names which are not used are ranked by ID, after the used ones.
+        nb_used_before = bisect_left(self._sorted_used_ids, name_id)
+        return len(self._usage) + name_id - nb_used_before
+
+    def name_at(self, rank):
+        """Return the name at this position in the ranking order."""
+        if not 0 <= rank < len(self._names):
+            raise IndexError("Name rank out of range: " + str(rank))
+        if rank < len(self._ranked_used_keys):
+            return self._names[self._ranked_used_keys[rank][1]]
+        # The name is the k-th name which is not used. Its ID is k plus the
+        # number of used names with a lower ID.
+        k = rank - len(self._ranked_used_keys)
+        name_id = k
+        while True:
+            next_id = k + bisect_right(self._sorted_used_ids, name_id)
+            if next_id == name_id:
+                return self._names[name_id]
+            name_id = next_id
+
+    def add(self, name):
+        """Add a name, ranked after the other names which are not used."""
+        if name in self._ids:
+            return
+        name_id = len(self._names)
+        self._names.append(name)
+        self._lower_names.append(name.lower())
+        self._ids[name] = name_id
+        if self._postings is not None:
+            self._index_name(name_id, self._lower_names[name_id])
+
+    def set_usage(self, name, count):
+        """Set the number of uses of the name. Raise KeyError if it is unknown."""
+        name_id = self._ids[name]
+        if name_id in self._usage:
+            del self._ranked_used_keys[bisect_left(self._ranked_used_keys, self._rank_key(name_id))]
+            del self._sorted_used_ids[bisect_left(self._sorted_used_ids, name_id)]
+            del self._usage[name_id]
+        if count > 0:
+            self._usage[name_id] = count
+            insort(self._ranked_used_keys, self._rank_key(name_id))
+            insort(self._sorted_used_ids, name_id)
+
+    # Private methods section.
+
+    def _build_postings(self):
+        self._postings = {}
+        for name_id, lower_name in enumerate(self._lower_names):
+            self._index_name(name_id, lower_name)
+
+    def _index_name(self, name_id, lower_name):
+        for gram in self._grams(lower_name):
+            posting = self._postings.get(gram)
+            if posting is None:
+                self._postings[gram] = array("I", [name_id])
+            else:
+                posting.append(name_id)
+
+    @classmethod
+    def _grams(cls, text):
+        return {text[i:i + cls.GRAM_LENGTH] for i in range(len(text) - cls.GRAM_LENGTH + 1)}
+
+    def _rank_key(self, name_id):
+        return -self._usage.get(name_id, 0), name_id
+
+    def _ranked_ids(self):
+        """Iterate over the name IDs in the ranking order."""
+        used_ids = (name_id for _, name_id in self._ranked_used_keys)
+        unused_ids = (name_id for name_id in range(len(self._names)) if name_id not in self._usage)
+        return chain(used_ids, unused_ids)
+
@@ -0,0 +1,183 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from warnings import warn
+
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal, pyqtSlot
+
+from neurocurator.utils import atomic_open, package_directory
+
+
+class OCRMonitor(QObject):
+    """Wait for the optical character recognition of the imported PDFs done by the REST server.
+
+    All the pending papers are checked by one worker thread, with an
+    exponential backoff per paper, and given up after a timeout. Results are
+    reported by signals, in the GUI thread.
+
+    Pending papers are saved as JSON in the package directory, to be checked
+    again after a restart.
+
+    check_fct(paper_id, db_path) checks if the OCR of the paper is finished
+    and, if it is, writes the PDF and its text in the database directory.
+    It is RESTClient.checkOCRFinished() for the application, or any function
+    querying a local stand-in server for tests.
+    """
+
+    # Emitted with the paper ID, the database path and if the user wants to be notified.
+    ocrFinished = pyqtSignal(str, str, bool)
+    # Emitted with the paper ID and the error message.
+    ocrFailed = pyqtSignal(str, str)
+    # Emitted with the paper ID when the OCR is not finished after TIMEOUT.
+    ocrTimedOut = pyqtSignal(str)
+    # Emitted with the number of papers waiting for their OCR.
+    pendingChanged = pyqtSignal(int)
+
+    # Delays between two checks of a paper, in seconds.
+    INITIAL_DELAY = 5
+    MAX_DELAY = 300
+    BACKOFF_FACTOR = 2
+    # Duration after which a paper is given up, in seconds.
+    TIMEOUT = 2 * 60 * 60
+
+    # Emitted, from the worker thread, with the results of the checks.
+    _checks_done = pyqtSignal(object)
+
+    def __init__(self, check_fct, jobs_path=None, parent=None):
+        super().__init__(parent)
+        self.check_fct = check_fct
+        if jobs_path is None:
+            jobs_path = os.path.join(package_directory(), "ocr_jobs.json")
+        self.jobs_path = jobs_path
+        # Paper ID -> job.
+        # Job keys: paper_id, db_path, notify, started (time.time()),
+        # delay and next_check (time.monotonic()).
+        self._jobs = {}
+        self._is_checking = False
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._check_due_jobs)
+        # NB: Queued to handle the results in the thread of the monitor, the GUI one.
+        self._checks_done.connect(self._dispatch, Qt.QueuedConnection)
+
+    # Public methods section.
+
+    def add(self, paper_id, db_path, notify=False):
+        """Wait for the OCR of the paper. Notify the user when it is finished if notify is True."""
+        job = self._jobs.get(paper_id)
+        if job is None:
+            self._jobs[paper_id] = self._new_job(paper_id, db_path, notify, time.time())
+        else:
+            job["notify"] = job["notify"] or notify
+        self.save()
+        self.pendingChanged.emit(len(self._jobs))
+        self._schedule()
+
+    def pending(self):
+        """Return the IDs of the papers waiting for their OCR."""
+        return list(self._jobs)
+
+    def shutdown(self):
+        """Stop checking. The pending papers are checked again at the next restore()."""
+        self._timer.stop()
+        self._jobs.clear()
+        self._executor.shutdown(wait=False)
+
+    # Data I/O methods section.
+
+    def restore(self):
+        """Wait again for the OCR of the papers saved as pending."""
+        try:
+            with open(self.jobs_path, "r", encoding="utf-8") as f:
+                saved_jobs = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            warn("Failed to load the papers waiting for their OCR: {}".format(e))
+            return
+        for saved_job in saved_jobs:
+            paper_id = saved_job["paper_id"]
+            if paper_id not in self._jobs:
+                self._jobs[paper_id] = self._new_job(paper_id, saved_job["db_path"],
+                                                     saved_job["notify"], saved_job["started"])
+        self.pendingChanged.emit(len(self._jobs))
+        self._schedule()
+
+    def save(self):
+        """Save the papers waiting for their OCR."""
+        saved_jobs = [{key: job[key] for key in ("paper_id", "db_path", "notify", "started")}
+                      for job in self._jobs.values()]
+        try:
+            with atomic_open(self.jobs_path, "w", encoding="utf-8") as f:
+                json.dump(saved_jobs, f)
+        except OSError as e:
+            warn("Failed to save the papers waiting for their OCR: {}".format(e))
+
+    # Private methods section.
+
+    def _new_job(self, paper_id, db_path, notify, started):
+        return {"paper_id": paper_id, "db_path": db_path, "notify": notify, "started": started,
+                "delay": self.INITIAL_DELAY, "next_check": time.monotonic() + self.INITIAL_DELAY}
+
+    def _schedule(self):
+        """Start the timer for the next check, if no check is running."""
+        if self._is_checking or not self._jobs:
+            return
+        next_check = min(job["next_check"] for job in self._jobs.values())
+        self._timer.start(max(0, int((next_check - time.monotonic()) * 1000)))
+
+    @pyqtSlot()
+    def _check_due_jobs(self):
+        now = time.monotonic()
+        due_jobs = [(job["paper_id"], job["db_path"]) for job in self._jobs.values()
+                    if job["next_check"] <= now]
+        if not due_jobs:
+            self._schedule()
+            return
+        self._is_checking = True
+        future = self._executor.submit(self._check, self.check_fct, due_jobs)
+        future.add_done_callback(lambda f: self._checks_done.emit(f.result()))
+
+    @staticmethod
+    def _check(check_fct, jobs):
+        """Return (paper ID, is finished or exception raised) for each job. Run in the worker thread."""
+        results = []
+        for paper_id, db_path in jobs:
+            try:
+                results.append((paper_id, check_fct(paper_id, db_path)))
+            except Exception as e:
+                results.append((paper_id, e))
+        return results
+
+    @pyqtSlot(object)
+    def _dispatch(self, results):
+        self._is_checking = False
+        now = time.time()
+        pending_count = len(self._jobs)
+        for paper_id, result in results:
+            job = self._jobs.get(paper_id)
+            if job is None:
+                # NB: The monitor has been shut down.
+                continue
+            if result is True:
+                del self._jobs[paper_id]
+                self.ocrFinished.emit(paper_id, job["db_path"], job["notify"])
+            elif isinstance(result, Exception) and not isinstance(result, OSError):
+                # NB: requests.ConnectionError is an OSError, the server may be back later.
+                del self._jobs[paper_id]
+                self.ocrFailed.emit(paper_id, str(result))
+            elif now - job["started"] > self.TIMEOUT:
+                del self._jobs[paper_id]
+                self.ocrTimedOut.emit(paper_id)
+            else:
+                job["delay"] = min(job["delay"] * self.BACKOFF_FACTOR, self.MAX_DELAY)
+                job["next_check"] = time.monotonic() + job["delay"]
+        if len(self._jobs) != pending_count:
+            self.save()
+            self.pendingChanged.emit(len(self._jobs))
+        self._schedule()
@@ -0,0 +1,199 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+from nat.ontoManager import OntoManager
+from .autocomplete import NameListModel
+from .name_index import NameIndex
+from .resources import LoadingMonitor
+
+
+class OntologyService(QObject):
+    """Give all the widgets a shared access to the ontology trees and dictionaries.
+
+    The ontology is loaded lazily, once for the whole process, on the first
+    access, or in advance with load(). Consumers register with acquire().
+    Data derived from the ontology are dropped when the last consumer is
+    released.
+    """
+
+    # Emitted when the ontology has been recomputed.
+    changed = pyqtSignal()
+    # Emitted with the ID and the name of a term added to the ontology.
+    termAdded = pyqtSignal(str, str)
+
+    _instance = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._onto_manager = None
+        self._onto_manager_lock = threading.Lock()
+        self._consumer_count = 0
+        self._names = None
+        self._index = None
+        self._name_model = None
+
+    @classmethod
+    def instance(cls):
+        """Return the ontology service shared by the whole process."""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    # Consumer registration section.
+
+    def acquire(self, consumer=None):
+        """Register a consumer of the ontology and return the service.
+
+        If the consumer is a QObject, it is released when it is destroyed.
+        """
+        self._consumer_count += 1
+        if isinstance(consumer, QObject):
+            consumer.destroyed.connect(self.release)
+        return self
+
+    @pyqtSlot()
+    @pyqtSlot(QObject)
+    def release(self, consumer=None):
+        """Unregister a consumer of the ontology."""
+        self._consumer_count = max(self._consumer_count - 1, 0)
+        if self._consumer_count == 0:
+            # NB: OntoManager keeps its own class-level copy of the pickled data.
+            self._onto_manager = None
+            self._invalidate()
+
+    def consumer_count(self):
+        """Return the number of registered consumers."""
+        return self._consumer_count
+
+    # Data access section.
+
+    @property
+    def trees(self):
+        """Return the ontological trees (root ID -> {ID: name})."""
+        return self._manager().trees
+
+    @property
+    def dics(self):
+        """Return the ontological dictionary (ID -> name)."""
+        return self._manager().dics
+
+    def names(self):
+        """Return the list of the term names."""
+        if self._names is None:
+            # FIXME Delayed refactoring. There should be no None values.
+            self._names = [name for name in self.dics.values() if name is not None]
+        return self._names
+
+    def name_model(self):
+        """Return the lazily populated list model of the term names, shared by the widgets.
+
+        Names are ranked by the numbers of uses set with NameListModel.setUsage().
+        """
+        if self._name_model is None:
+            self._name_model = NameListModel(NameIndex(self.names()), self)
+        return self._name_model
+
+    @property
+    def index(self):
+        """Return the name/ID index of the ontology."""
+        if self._index is None:
+            self._index = OntologyIndex(self.dics, self.trees)
+        return self._index
+
+    # Data I/O methods section.
+
+    def load(self):
+        """Load the ontology if necessary. Can be called from a worker thread."""
+        self._manager()
+
+    def recompute(self):
+        """Rebuild the ontology from the ontology services and notify the consumers."""
+        with LoadingMonitor.instance().loading("ontology"):
+            self._onto_manager = OntoManager(recompute=True)
+        self._invalidate()
+        self.changed.emit()
+
+    def add_term(self, term_id, name):
+        """Add a term to the ontological dictionary, persist it and notify the consumers.
+
+        Consumers are notified with termAdded, to update their data incrementally.
+        """
+        self.dics[term_id] = name
+        # NB: The derived data are updated instead of being rebuilt.
+        if self._names is not None:
+            self._names.append(name)
+        if self._name_model is not None:
+            self._name_model.addName(name)
+        if self._index is not None:
+            self._index.add_term(term_id, name)
+        self.save()
+        self.termAdded.emit(term_id, name)
+
+    def save(self):
+        """Persist the local modifications of the ontology."""
+        self._manager().savePickle()
+
+    # Private methods section.
+
+    def _manager(self):
+        """Return the OntoManager, loading the ontology if necessary."""
+        if self._onto_manager is None:
+            # NB: The ontology may be loaded by a worker thread at the startup.
+            with self._onto_manager_lock:
+                if self._onto_manager is None:
+                    with LoadingMonitor.instance().loading("ontology"):
+                        self._onto_manager = OntoManager()
+        return self._onto_manager
+
+    def _invalidate(self):
+        """Drop the data derived from the ontology."""
+        self._names = None
+        self._index = None
+        self._name_model = None
+
+
+class OntologyIndex:
+    """Bidirectional index between the term names and the term IDs.
+
+    Lookups are dictionary hits instead of scans of the ontological
+    dictionary. Names of the terms of a tree are grouped, on first use, in a
+    set to check membership in constant time.
+    """
+
+    def __init__(self, dics, trees):
+        self._dics = dics
+        self._trees = trees
+        self._ids = {}
+        for term_id, name in dics.items():
+            # NB: The first ID found for a name is kept, as with list.index().
+            self._ids.setdefault(name, term_id)
+        self._subtree_names = {}
+
+    def id_for_name(self, name):
+        """Return the ID of the term with this name. Raise KeyError if there is none."""
+        return self._ids[name]
+
+    def name_for_id(self, term_id):
+        """Return the name of the term with this ID. Raise KeyError if there is none."""
+        return self._dics[term_id]
+
+    def is_root(self, term_id):
+        """Check if the term is the root of an ontological tree."""
+        return term_id in self._trees
+
+    def subtree_names(self, root_id):
+        """Return the set of the names of the terms in the tree with this root."""
+        try:
+            return self._subtree_names[root_id]
+        except KeyError:
+            names = frozenset(self._trees[root_id].values())
+            self._subtree_names[root_id] = names
+            return names
+
+    def add_term(self, term_id, name):
+        """Index a term added to the ontological dictionary."""
+        self._ids.setdefault(name, term_id)
@@ -0,0 +1,119 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import os
+from collections import Counter
+
+from nat.utils import Id2FileName
+from neurocurator.annotation_store import AnnotationStore
+
+
+class PaperSession:
+    """Annotations of the paper being curated, shared by the widgets of the main window.
+
+    The annotation file (.pcr) is parsed once. Annotations, tag counts and
+    parameter instances are derived from it on first use. Tag counts are
+    updated by the writes through the session. Derived data are computed
+    again only after a modification of the file by another program.
+    """
+
+    def __init__(self, db_path, paper_id):
+        self.db_path = db_path
+        self.paper_id = paper_id
+        self.path = os.path.join(db_path, Id2FileName(paper_id)) + ".pcr"
+        self._store = AnnotationStore.for_path(self.path)
+        # Data derived from the annotations, with the store generation they come from.
+        self._tags_generation = None
+        self._tag_counts = None
+        # Annotation ID -> tag IDs, to update the tag counts.
+        self._annotation_tag_ids = None
+        self._parameters_generation = None
+        self._parameters = None
+
+    def is_for(self, db_path, paper_id):
+        """Check if the session is the one of this paper."""
+        return self.db_path == db_path and self.paper_id == paper_id
+
+    # Public methods section.
+
+    def is_up_to_date(self):
+        """Check if the annotation file has not been modified by another program since it was read."""
+        return self._store.is_up_to_date()
+
+    def annotations(self):
+        """Return copies of the annotations of the paper.
+
+        Raise FileNotFoundError if the paper has no annotation file.
+        """
+        return self._store.annotations()
+
+    def annotation_ids(self):
+        """Return the IDs of the annotations of the paper."""
+        return self._store.ids()
+
+    def tag_counts(self):
+        """Return the number of annotations of the paper per tag ID.
+
+        Return an empty Counter if the paper has no annotation file.
+        """
+        try:
+            generation = self._store.generation()
+        except FileNotFoundError:
+            return Counter()
+        if generation != self._tags_generation:
+            self._annotation_tag_ids = {annotation.ID: [tag.id for tag in annotation.tags]
+                                        for annotation in self._store.shared_annotations()}
+            self._tag_counts = Counter()
+            for tag_ids in self._annotation_tag_ids.values():
+                self._tag_counts.update(tag_ids)
+            self._tags_generation = generation
+        return self._tag_counts
+
+    def parameters(self):
+        """Return the parameter instances of the annotations of the paper.
+
+        The instances are shared between the callers. They must not be modified.
+        Raise FileNotFoundError if the paper has no annotation file.
+        """
+        generation = self._store.generation()
+        if generation != self._parameters_generation:
+            self._parameters = [parameter for annotation in self._store.shared_annotations()
+                                for parameter in annotation.parameters]
+            self._parameters_generation = generation
+        return self._parameters
+
+    # Data I/O methods section.
+
+    def save(self, annotation):
+        """Replace the annotation with the same ID, or append it, and write the file."""
+        self.save_all([annotation])
+
+    def save_all(self, annotations):
+        """Replace the annotations with the same IDs, or append them, and write the file."""
+        is_up_to_date = self._tags_generation == self._store.generation()
+        self._store.save_all(annotations)
+        if is_up_to_date:
+            for annotation in annotations:
+                self._update_tag_counts(annotation.ID, [tag.id for tag in annotation.tags])
+            self._tags_generation = self._store.generation()
+
+    def delete(self, annotation_id):
+        """Remove the annotation with this ID, if it has been saved, and write the file."""
+        if annotation_id not in self._store.ids():
+            return
+        is_up_to_date = self._tags_generation == self._store.generation()
+        self._store.delete(annotation_id)
+        if is_up_to_date:
+            self._update_tag_counts(annotation_id, [])
+            self._tags_generation = self._store.generation()
+
+    # Private methods section.
+
+    def _update_tag_counts(self, annotation_id, tag_ids):
+        """Replace in the tag counts the tags of the annotation."""
+        self._tag_counts.subtract(self._annotation_tag_ids.pop(annotation_id, []))
+        self._tag_counts.update(tag_ids)
+        # NB: Counter.subtract() keeps the tags which are not used anymore.
+        self._tag_counts += Counter()
+        if tag_ids:
+            self._annotation_tag_ids[annotation_id] = tag_ids
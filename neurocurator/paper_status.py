@@ -0,0 +1,104 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import os
+import threading
+
+from nat.utils import Id2FileName
+
+
+class PaperStatusIndex:
+    """Files of each paper of a database: its record (.pcr), its PDF and its text.
+
+    Built by one scan of the database directory, on the first lookup. Then
+    kept up to date by the application when it writes the files of a paper,
+    with update_paper() or update_file(). A status lookup is a dictionary
+    lookup, without access to the file system.
+
+    Thread-safe: the Zotero loading thread and the GUI thread use it.
+    """
+
+    # Paper statuses.
+    # There is no record yet for the paper.
+    NO_RECORD = 0
+    # There is a record, but no PDF or no text.
+    RECORD = 1
+    # There is a record, a PDF and a text.
+    COMPLETE = 2
+
+    EXTENSIONS = (".pcr", ".pdf", ".txt")
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_path):
+        self.db_path = os.path.abspath(db_path)
+        # File name without extension -> extensions of the files of the paper.
+        self._files = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def for_path(cls, db_path):
+        """Return the index shared by the whole process for this database path."""
+        db_path = os.path.abspath(db_path)
+        with cls._instances_lock:
+            if db_path not in cls._instances:
+                cls._instances[db_path] = cls(db_path)
+            return cls._instances[db_path]
+
+    # Data I/O methods section.
+
+    def update(self):
+        """Scan the database directory again."""
+        files = {}
+        try:
+            entries = list(os.scandir(self.db_path))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            name, extension = os.path.splitext(entry.name)
+            if extension in self.EXTENSIONS and entry.is_file():
+                files.setdefault(name, set()).add(extension)
+        with self._lock:
+            self._files = files
+
+    def update_file(self, path):
+        """Check again a file of a paper which has been written or deleted."""
+        name, extension = os.path.splitext(os.path.basename(path))
+        if extension not in self.EXTENSIONS:
+            return
+        exists = os.path.isfile(os.path.join(self.db_path, name + extension))
+        with self._lock:
+            self._ensure_built()
+            extensions = self._files.setdefault(name, set())
+            if exists:
+                extensions.add(extension)
+            else:
+                extensions.discard(extension)
+                if not extensions:
+                    del self._files[name]
+
+    def update_paper(self, paper_id):
+        """Check again all the files of the paper."""
+        name = Id2FileName(paper_id)
+        for extension in self.EXTENSIONS:
+            self.update_file(name + extension)
+
+    # Public methods section.
+
+    def status(self, paper_id):
+        """Return the status of the paper: NO_RECORD, RECORD or COMPLETE."""
+        with self._lock:
+            self._ensure_built()
+            extensions = self._files.get(Id2FileName(paper_id))
+            if not extensions or ".pcr" not in extensions:
+                return self.NO_RECORD
+            if ".pdf" not in extensions or ".txt" not in extensions:
+                return self.RECORD
+            return self.COMPLETE
+
+    # Private methods section.
+
+    def _ensure_built(self):
+        if self._files is None:
+            self.update()
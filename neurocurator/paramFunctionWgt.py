@@ -7,20 +7,14 @@ from PyQt5.QtWidgets import (QTableView, QMessageBox, QLabel, QGridLayout,
                              QTabWidget, QLineEdit, QAbstractItemView, QWidget,
                              QPushButton)
 
-from nat.annotation import getParametersForPub
-from nat.modelingParameter import (getParameterTypes, ParameterTypeTree,
-                                   getParameterTypeNameFromID)
+from nat.modelingParameter import getParameterTypeNameFromID
 from nat.paramDesc import ParamDescFunction, InvalidEquation, ParamRef
 from nat.parameterInstance import ParameterInstance
-from nat.utils import Id2FileName
 from .itemDelegates import CheckBoxDelegate
+from .resources import parameter_types
 from .variableTableWgt import VariableTableView, VariableListModel
 
 
-parameterTypeTree = ParameterTypeTree.load()
-parameterTypes = getParameterTypes()
-
-
 class ParamFunctionWgt(QWidget):
 
     paramTypeSelected = pyqtSignal(str)
@@ -30,7 +24,7 @@ class ParamFunctionWgt(QWidget):
 
         self._parent = parent
 
-        self.parameterTypes = getParameterTypes()
+        self.parameterTypes = parameter_types.get()
 
         # Widgets        
         self.addIndepVarBtn = QPushButton("Add variable")
@@ -152,7 +146,7 @@ class ParamFunctionWgt(QWidget):
 
 
     def fillingEquationParameterList(self, currentParameter = None):
-        parameters = getParametersForPub(self._parent.dbPath, Id2FileName(self._parent.currentAnnotation.pubId))
+        parameters = self._parent.paperSession.parameters()
         parameters = [param for param in parameters if param.isExperimentProperty == False]
         if currentParameter is None:
             selectedParams = []
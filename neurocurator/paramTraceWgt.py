@@ -5,10 +5,10 @@ __author__ = "Christian O'Reilly"
 from PyQt5.QtCore import pyqtSignal, pyqtSlot, QItemSelection, QModelIndex
 from PyQt5.QtWidgets import QWidget, QAbstractItemView, QPushButton, QGridLayout
 
-from nat.modelingParameter import getParameterTypes
 from nat.paramDesc import ParamDescTrace
 from nat.parameterInstance import ParameterInstance
 
+from .resources import parameter_types
 from .variableTableWgt import VariableTableView, VariableListModel
 
 
@@ -19,7 +19,7 @@ class ParamTraceWgt(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
 
-        self.parameterTypes = getParameterTypes()
+        self.parameterTypes = parameter_types.get()
 
         # Widgets        
         self.varListTblWdg = VariableTableView(self)
@@ -7,16 +7,14 @@ from PyQt5.QtCore import QModelIndex, pyqtSignal, pyqtSlot, Qt, QAbstractTableMo
 from PyQt5.QtWidgets import (QTableView, QMessageBox, QLabel, QGridLayout,
                              QAbstractItemView, QTextEdit, QWidget)
 
-from nat.modelingParameter import getParameterTypes, getParameterTypeIDFromName
+from nat.modelingParameter import getParameterTypeIDFromName
 from nat.paramDesc import ParamDescPoint
 from nat.parameterInstance import ParameterInstance
 from nat.values import ValuesSimple, ValuesCompound
 from nat.variable import NumericalVariable
 from .itemDelegates import (ParamTypeCbo, DoubleDelegate, UnitDelegate,
                             StatisticsDelegate, ButtonDelegate)
-
-
-parameterTypes = getParameterTypes()
+from .resources import parameter_types
 
 
 class ParamValueWgt(QWidget):
@@ -57,7 +55,7 @@ class ParamValueWgt(QWidget):
 
     def paramTypeChanged(self, paramName):
         self.paramTypeSelected.emit(paramName)
-        for paramType in parameterTypes:
+        for paramType in parameter_types.get():
             if paramType.name == paramName:
                 self.paramDescription.setText(paramType.description)
             
@@ -0,0 +1,217 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import io
+import json
+import os
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZipFile
+
+import requests
+from PyQt5.QtCore import QObject, Qt, pyqtSignal, pyqtSlot
+
+from nat.restClient import RESTClient, RESTClientError, RESTImportPDFErr
+
+
+class ImportRESTClient(RESTClient):
+    """REST client reporting the progress of the PDF uploads, which can be cancelled.
+
+    Same protocol as RESTClient.importPDF(), with the multipart request body
+    streamed from the file instead of being built in memory.
+    """
+
+    def importPDF(self, localPDF, paperId, pathDB, progress=None, is_cancelled=None):
+        """Upload the PDF and write the PDF and its text in the database directory.
+
+        progress is called with the number of bytes uploaded and the size of
+        the request. is_cancelled is called during the upload and before
+        writing the files. If it returns True, ImportCancelled is raised.
+
+        Raise RESTImportPDFErr if the PDF needs OCR, RESTClientError if the
+        server returned an error, and the exceptions of requests if the
+        server can't be reached.
+        """
+        def check_cancelled():
+            if is_cancelled is not None and is_cancelled():
+                raise ImportCancelled("The import of the PDF of " + paperId + " has been cancelled.")
+
+        boundary = uuid.uuid4().hex
+        with open(localPDF, "rb") as f:
+            body = _MultipartBody(boundary, os.path.basename(localPDF), f,
+                                  json.dumps({"paperId": paperId}), progress, check_cancelled)
+            response = requests.post(self.serverURL + "import_pdf", data=body,
+                                     headers={"Content-Type": "multipart/form-data; boundary=" + boundary})
+        check_cancelled()
+
+        if response.status_code == 200:
+            ZipFile(io.BytesIO(response.content)).extractall(pathDB)
+        elif response.status_code == 201:
+            raise RESTImportPDFErr("Optical character recognition needs to be run on this paper. "
+                                   "The process has been launched, but this process may take some"
+                                   " time (i.e., in the order of 10 minutes).")
+        else:
+            raise RESTClientError("REST server returned an error number " + str(response.status_code)
+                                  + " for the import of the PDF " + localPDF + ".")
+
+
+# PDF to import.
+# cancelled: threading.Event set when the import is cancelled.
+_ImportJob = namedtuple("_ImportJob", ["paper_id", "pdf_path", "db_path", "cancelled"])
+
+
+class PDFImporter(QObject):
+    """Import PDFs through the REST server, in worker threads.
+
+    import_fct(pdf_path, paper_id, db_path, progress, is_cancelled) uploads
+    the PDF and writes the PDF and its text in the database directory. It is
+    ImportRESTClient.importPDF() for the application.
+
+    The PDFs are imported in the order they were queued, max_workers at the
+    same time. Results are reported by signals, in the GUI thread. Creating
+    the annotation file of the paper is left to the receivers of imported.
+    """
+
+    # Emitted with the paper ID when its import starts.
+    importStarted = pyqtSignal(str)
+    # Emitted with the number of bytes uploaded, the size of the upload and a message.
+    importProgress = pyqtSignal(int, int, str)
+    # Emitted with the paper ID and the database path when the PDF and its text have been written.
+    imported = pyqtSignal(str, str)
+    # Emitted with the paper ID, the database path and the message when the PDF needs OCR.
+    ocrNeeded = pyqtSignal(str, str, str)
+    # Emitted with the paper ID and the error message.
+    importFailed = pyqtSignal(str, str)
+    importCancelled = pyqtSignal(str)
+    # Emitted with the number of PDFs waiting for their import or being imported.
+    queueChanged = pyqtSignal(int)
+
+    # Emitted, from the worker thread, with the job and its future.
+    _job_done = pyqtSignal(object, object)
+
+    def __init__(self, import_fct, max_workers=1, parent=None):
+        super().__init__(parent)
+        self.import_fct = import_fct
+        # Jobs queued or running, in the order they were queued.
+        self._jobs = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # NB: Queued to handle the results in the thread of the importer, the GUI one.
+        self._job_done.connect(self._dispatch, Qt.QueuedConnection)
+
+    # Public methods section.
+
+    def enqueue(self, paper_id, pdf_path, db_path):
+        """Queue the import of the PDF. Return False if the PDF of the paper is already queued."""
+        if self.is_queued(paper_id):
+            return False
+        job = _ImportJob(paper_id, pdf_path, db_path, threading.Event())
+        self._jobs.append(job)
+        future = self._executor.submit(self._run, job)
+        future.add_done_callback(lambda f: self._job_done.emit(job, f))
+        self.queueChanged.emit(len(self._jobs))
+        return True
+
+    def is_queued(self, paper_id):
+        """Check if the PDF of the paper is waiting for its import or being imported."""
+        return any(job.paper_id == paper_id for job in self._jobs)
+
+    def queued(self):
+        """Return the IDs of the papers whose PDF is waiting for its import or being imported."""
+        return [job.paper_id for job in self._jobs]
+
+    def cancel(self, paper_id=None):
+        """Cancel the import of the PDF of the paper, or of all the PDFs if paper_id is None.
+
+        An upload is stopped at its next block. Once the upload is done, the
+        import is cancelled only if the files have not been written yet.
+        """
+        for job in self._jobs:
+            if paper_id is None or job.paper_id == paper_id:
+                job.cancelled.set()
+
+    def shutdown(self):
+        """Cancel all the imports. The results of the imports running are not reported."""
+        self.cancel()
+        self._jobs.clear()
+        self._executor.shutdown(wait=False)
+
+    # Private methods section.
+
+    def _run(self, job):
+        """Import the PDF. Run in the worker thread."""
+        if job.cancelled.is_set():
+            raise ImportCancelled("The import of the PDF of " + job.paper_id + " has been cancelled.")
+        # NB: Signals emitted from the worker thread are queued to the receivers in the GUI thread.
+        self.importStarted.emit(job.paper_id)
+        message = "Uploading the PDF of " + job.paper_id + "..."
+
+        def progress(count, size):
+            self.importProgress.emit(count, size, message)
+
+        self.import_fct(job.pdf_path, job.paper_id, job.db_path, progress, job.cancelled.is_set)
+
+    @pyqtSlot(object, object)
+    def _dispatch(self, job, future):
+        if job not in self._jobs:
+            # NB: The importer has been shut down.
+            return
+        self._jobs.remove(job)
+        exception = future.exception()
+        if exception is None:
+            self.imported.emit(job.paper_id, job.db_path)
+        elif isinstance(exception, ImportCancelled):
+            self.importCancelled.emit(job.paper_id)
+        elif isinstance(exception, RESTImportPDFErr):
+            self.ocrNeeded.emit(job.paper_id, job.db_path, str(exception))
+        else:
+            self.importFailed.emit(job.paper_id, str(exception))
+        self.queueChanged.emit(len(self._jobs))
+
+
+class _MultipartBody:
+    """Body of a multipart/form-data request with a file and a JSON part, read by blocks.
+
+    Same parts as the request of RESTClient.importPDF(). The size is known,
+    so the request is sent with a Content-Length and not chunked.
+    """
+
+    def __init__(self, boundary, file_name, file, json_content, progress=None, check_cancelled=None):
+        head = ("--{0}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{1}\"\r\n"
+                "Content-Type: application/octet-stream\r\n\r\n").format(boundary, file_name)
+        tail = ("\r\n--{0}\r\nContent-Disposition: form-data; name=\"json\"\r\n"
+                "Content-Type: application/json\r\n\r\n{1}\r\n--{0}--\r\n").format(boundary, json_content)
+        file.seek(0, io.SEEK_END)
+        file_size = file.tell()
+        file.seek(0)
+        self._parts = [io.BytesIO(head.encode("utf-8")), file, io.BytesIO(tail.encode("utf-8"))]
+        self._size = len(head.encode("utf-8")) + file_size + len(tail.encode("utf-8"))
+        self._count = 0
+        # Last percentage reported, to report the progress at most 100 times.
+        self._percentage = -1
+        self._progress = progress
+        self._check_cancelled = check_cancelled
+
+    def __len__(self):
+        return self._size
+
+    def read(self, size=-1):
+        if self._check_cancelled is not None:
+            self._check_cancelled()
+        data = b""
+        while self._parts and (size < 0 or len(data) < size):
+            block = self._parts[0].read(-1 if size < 0 else size - len(data))
+            if not block:
+                self._parts.pop(0)
+            data += block
+        self._count += len(data)
+        percentage = self._count * 100 // self._size if self._size else 100
+        if self._progress is not None and percentage != self._percentage:
+            self._percentage = percentage
+            self._progress(self._count, self._size)
+        return data
+
+
+class ImportCancelled(Exception):
+    """Raise when the import of a PDF is cancelled."""
@@ -0,0 +1,87 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import sys
+import time
+from contextlib import contextmanager
+
+from .resources import LoadingMonitor
+
+
+class StartupProfiler:
+    """Measure the duration of the phases of the startup.
+
+    Phases can be nested. The time of a phase excludes the time of its
+    sub-phases. The loadings reported by LoadingMonitor, including the ones
+    done in worker threads, are listed after the phases.
+    """
+
+    # Profiler used by profile_phase(), if the startup is profiled.
+    _active = None
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        # (depth, name, total duration, own duration), in the order the phases started.
+        self._records = []
+        self._stack = []
+        # (name, duration) of the resources loaded, in the order they were loaded.
+        self._loadings = []
+
+    @classmethod
+    def active(cls):
+        """Return the profiler of the startup, or None if it is not profiled."""
+        return cls._active
+
+    def activate(self):
+        """Make it the profiler of the startup and listen to the loadings of resources."""
+        StartupProfiler._active = self
+        LoadingMonitor.instance().loadingFinished.connect(self._loading_finished)
+
+    @contextmanager
+    def phase(self, name):
+        """Measure the duration of the phase done in the with block."""
+        index = len(self._records)
+        self._records.append(None)
+        # Time spent in the sub-phases, updated by them.
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            nested = self._stack.pop()
+            self._records[index] = (len(self._stack), name, duration, duration - nested)
+            if self._stack:
+                self._stack[-1] += duration
+
+    def report(self, file=None):
+        """Print the duration of each phase and of each loading of resources."""
+        file = sys.stderr if file is None else file
+        total = time.perf_counter() - self._start
+        print("Startup profile (seconds):", file=file)
+        print("  {:<40} {:>8} {:>8}".format("Phase", "Total", "Self"), file=file)
+        # NB: Phases not finished yet are not reported.
+        for depth, name, duration, own in filter(None, self._records):
+            label = "  " * depth + name
+            print("  {:<40} {:>8.3f} {:>8.3f}".format(label, duration, own), file=file)
+        if self._loadings:
+            print("  Loadings:", file=file)
+            for name, duration in self._loadings:
+                print("  {:<40} {:>8.3f}".format("  " + name, duration), file=file)
+        print("  {:<40} {:>8.3f}".format("Total", total), file=file)
+
+    # Private methods section.
+
+    def _loading_finished(self, name, duration):
+        self._loadings.append((name, duration))
+
+
+@contextmanager
+def profile_phase(name):
+    """Measure the phase done in the with block if the startup is profiled."""
+    profiler = StartupProfiler.active()
+    if profiler is None:
+        yield
+    else:
+        with profiler.phase(name):
+            yield
@@ -0,0 +1,76 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import threading
+import time
+from contextlib import contextmanager
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from nat.modelingParameter import getParameterTypes
+
+
+class LoadingMonitor(QObject):
+    """Report the loading of the resources shared by the whole application.
+
+    Used to show the progress of the startup and to profile it.
+    """
+
+    # Emitted with the name of the resource.
+    loadingStarted = pyqtSignal(str)
+    # Emitted with the name of the resource and the loading duration, in seconds.
+    loadingFinished = pyqtSignal(str, float)
+
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        """Return the loading monitor shared by the whole process."""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @contextmanager
+    def loading(self, name):
+        """Report the loading of the resource done in the with block."""
+        self.loadingStarted.emit(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.loadingFinished.emit(name, time.perf_counter() - start)
+
+
+class LazyResource:
+    """Value loaded on first access, once for the whole process.
+
+    Thread-safe: a resource accessed by several threads is loaded once.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._value = None
+        self._is_loaded = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the value, loading it if necessary."""
+        if not self._is_loaded:
+            with self._lock:
+                if not self._is_loaded:
+                    with LoadingMonitor.instance().loading(self.name):
+                        self._value = self._loader()
+                    self._is_loaded = True
+        return self._value
+
+    def is_loaded(self):
+        """Check if the value has been loaded."""
+        return self._is_loaded
+
+
+# Resources section.
+
+# Types of the modeling parameters.
+# NB: They must not be modified, they are shared by all the widgets.
+parameter_types = LazyResource("parameter types", getParameterTypes)
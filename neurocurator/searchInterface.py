@@ -2,7 +2,6 @@
 
 __author__ = "Christian O'Reilly"
 
-import numpy as np
 import pandas as pd
 from PyQt5.QtCore import QModelIndex, pyqtSignal, pyqtSlot, Qt, QAbstractTableModel
 from PyQt5.QtWidgets import (QTableView, QCheckBox, QVBoxLayout, QWidget,
@@ -10,14 +9,16 @@ from PyQt5.QtWidgets import (QTableView, QCheckBox, QVBoxLayout, QWidget,
                              QFileDialog, QSplitter, QPushButton,
                              QAbstractItemView, QHeaderView)
 
+from nat.annotation import Annotation
 from nat.annotationSearch import (parameterKeys, annotationKeys,
                                   ParameterSearch,
                                   AnnotationSearch, parameterResultFields,
                                   annotationResultFields)
 from nat.condition import ConditionAtom, ConditionAND, ConditionOR, ConditionNOT
-from nat.ontoManager import OntoManager
+from .annotation_index import AnnotationCorpusIndex
 from .autocomplete import AutoCompleteEdit
 from .itemDelegates import ParamTypeCbo, CheckBoxDelegate
+from .ontology import OntologyService
 
 
 class SearchWgt(QWidget):
@@ -91,7 +92,14 @@ class SearchWgt(QWidget):
             dbPath = self._parent.dbPath
 
         if self.searchType == "Parameter":
-            searcher = ParameterSearch(dbPath)
+            if dbPath is None:
+                searcher = ParameterSearch(dbPath)
+            else:
+                # NB: Only the files with parameters are read. The others have nothing to return.
+                corpusIndex = AnnotationCorpusIndex.for_path(dbPath)
+                corpusIndex.update()
+                corpus = FileCorpus(corpusIndex.files_with_parameters())
+                searcher = ParameterSearch(dbPath, corpus)
         elif self.searchType == "Annotation":
             searcher = AnnotationSearch(dbPath)
         else:
@@ -104,8 +112,7 @@ class SearchWgt(QWidget):
         self.outputFormat.setSearcherProperties(searcher)
             
         result = searcher.search()
-        self.model._data = result
-        self.model.refresh()
+        self.model.load(result)
         
     def saveResults(self):
         
@@ -113,7 +120,28 @@ class SearchWgt(QWidget):
         if not fname == "":
             if not "." in fname:
                 fname = fname + ".csv"
-            self.model._data.to_csv(fname)
+            self.model.dataFrame().to_csv(fname)
+
+
+class FileCorpus:
+    """Annotations of some annotation files, searched instead of the whole database.
+
+    Same interface as nat.annotationSearch.CompiledCorpus.
+    """
+
+    def __init__(self, fileNames):
+        self.fileNames = fileNames
+
+    def getAllAnnotations(self):
+        annotations = []
+        for fileName in self.fileNames:
+            try:
+                with open(fileName, "r", encoding="utf-8", errors="ignore") as f:
+                    annotations.extend(Annotation.readIn(f))
+            except FileNotFoundError:
+                # NB: Deleted since the index has been updated.
+                continue
+        return annotations
 
 
 class QueryDefinitionWgt(QGroupBox):
@@ -229,18 +257,11 @@ class QueryNodeWgt(QWidget):
 class QueryRowWgt(QWidget):
 
     valueTypeChanged = pyqtSignal(object)
-    
-    ontoMng  = OntoManager()
-    treeData = ontoMng.trees 
-    dicData  = ontoMng.dics
 
-    tagNames  = np.array(list(dicData.values()))      
-    del dicData
-    del treeData    
-    
     def __init__(self, searchType, parent=None):
         super().__init__(parent)
         
+        self.ontology   = OntologyService.instance().acquire(self)
         self.searchType = searchType
         self.valueType  = QComboBox(self)
         self.valueType.addItem("")
@@ -276,7 +297,7 @@ class QueryRowWgt(QWidget):
             self.value = ParamTypeCbo(self)
         elif self.valueType.currentText() in ["Tag name", "Required tag name"]:
             self.value = AutoCompleteEdit(self)
-            self.value.setModel(QueryRowWgt.tagNames)                        
+            self.value.setSharedModel(self.ontology.name_model())
         elif self.valueType.currentText() == "Result type":
             self.value = QComboBox(self)
             self.value.addItems(["pointValue", "function", "numericalTrace"])
@@ -375,40 +396,62 @@ class OutputPropertiesWgt(QWidget):
 
 
 class PandasModel(QAbstractTableModel):
-
-    def __init__(self, data=pd.DataFrame(), parent=None):
+    """
+     Table model for the search results. The DataFrame is split once, when
+     it is loaded, into per-column arrays so that painting a cell is only an
+     array lookup (no DataFrame-to-ndarray conversion, no column scan).
+     Columns prefixed with "obj_" hold the found objects and are not displayed.
+    """
+
+    def __init__(self, data=None, parent=None):
         super().__init__(parent)
+        self.load(pd.DataFrame() if data is None else data)
+
+    def load(self, data):
+        self.beginResetModel()
         self._data = data
+        displayed = [no for no, col in enumerate(data.columns) if col[:4] != "obj_"]
+        self._columns = [data.columns[no] for no in displayed]
+        # NB: Positional access to support duplicated column names. Values of
+        # a single-dtype column are a view on the DataFrame block, not a copy.
+        self._columnValues = [data.iloc[:, no].values for no in displayed]
+        self._objectValues = {col: data.iloc[:, no].values
+                              for no, col in enumerate(data.columns) if col[:4] == "obj_"}
+        self._rowLabels = data.index.values
+        self.endResetModel()
+
+    def dataFrame(self):
+        return self._data
 
     def rowCount(self, parent=QModelIndex()):
-        return len(self._data.values)
+        if parent.isValid():
+            return 0
+        return len(self._rowLabels)
 
     def columns(self):
-        return [col for col in self._data.columns if col[:4] != "obj_"] 
-        
-    def indDisplayColumns(self):
-        return [no for no, col in enumerate(self._data.columns) if col[:4] != "obj_"] 
+        return self._columns
 
     def columnCount(self, parent=QModelIndex()):
-        return len(self.columns())
+        if parent.isValid():
+            return 0
+        return len(self._columns)
 
-    def data(self, index, role= Qt.DisplayRole):
+    def data(self, index, role=Qt.DisplayRole):
         if index.isValid():
             if role == Qt.DisplayRole:
-                return str(self._data.values[index.row()][self.indDisplayColumns()[index.column()]])
+                return str(self._columnValues[index.column()][index.row()])
         return None
 
     def getObject(self, index, objField):
-        for col in self._data.columns:
-            if col == objField: 
-                return self._data[objField][index.row()]
-        raise ValueError
+        if not objField in self._objectValues:
+            raise ValueError
+        return self._objectValues[objField][index.row()]
 
     def headerData(self, index, orientation, role=Qt.DisplayRole):
         if   orientation == Qt.Horizontal and role == Qt.DisplayRole:
-            return self.columns()[index]
+            return str(self._columns[index])
         elif orientation == Qt.Vertical and role == Qt.DisplayRole:
-            return str(self._data.index[index])
+            return str(self._rowLabels[index])
         return None
 
 
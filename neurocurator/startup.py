@@ -0,0 +1,91 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, Qt, pyqtSignal, pyqtSlot
+
+from .resources import LoadingMonitor
+
+
+class StartupPipeline(QObject):
+    """Run the independent loading phases of the startup in worker threads.
+
+    The window is built and shown while the phases run. Each phase is a
+    function called in a worker thread, with a callback called in the GUI
+    thread with its result, to enable the widgets needing it.
+
+    Phases must not touch the widgets. Callbacks must not block.
+    """
+
+    # Emitted with the name of the phase and its result.
+    phaseFinished = pyqtSignal(str, object)
+    # Emitted with the name of the phase and the exception it raised, if it has no error callback.
+    phaseFailed = pyqtSignal(str, object)
+    # Emitted when all the phases started are done.
+    finished = pyqtSignal()
+
+    # Emitted, from a worker thread, with the name and the future of a phase.
+    _phase_done = pyqtSignal(str, object)
+
+    def __init__(self, max_workers=4, parent=None):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Name -> (ready callback, error callback), for the phases running.
+        self._callbacks = {}
+        # NB: Queued to call the callbacks in the thread of the pipeline, the GUI one.
+        self._phase_done.connect(self._dispatch, Qt.QueuedConnection)
+        # NB: Created here to live in the GUI thread, not in a worker one.
+        LoadingMonitor.instance()
+
+    # Public methods section.
+
+    def start(self, name, load, ready=None, error=None):
+        """Call load() in a worker thread, then ready(result) or error(exception) in the GUI thread."""
+        if name in self._callbacks:
+            raise ValueError("The startup phase '" + name + "' is already running.")
+        self._callbacks[name] = (ready, error)
+        future = self._executor.submit(self._run, name, load)
+        future.add_done_callback(lambda f: self._phase_done.emit(name, f))
+
+    def is_running(self, name):
+        """Check if the phase is running or its callback has not been called yet."""
+        return name in self._callbacks
+
+    def running(self):
+        """Return the names of the phases running."""
+        return list(self._callbacks)
+
+    def shutdown(self, wait=True):
+        """Stop accepting phases. Wait for the running ones if wait is True.
+
+        The callbacks of the phases finishing afterwards are not called.
+        """
+        self._callbacks.clear()
+        self._executor.shutdown(wait=wait)
+
+    # Private methods section.
+
+    @staticmethod
+    def _run(name, load):
+        with LoadingMonitor.instance().loading(name):
+            return load()
+
+    @pyqtSlot(str, object)
+    def _dispatch(self, name, future):
+        if name not in self._callbacks:
+            # NB: The pipeline has been shut down.
+            return
+        ready, error = self._callbacks.pop(name)
+        exception = future.exception()
+        if exception is None:
+            result = future.result()
+            if ready is not None:
+                ready(result)
+            self.phaseFinished.emit(name, result)
+        elif error is not None:
+            error(exception)
+        else:
+            self.phaseFailed.emit(name, exception)
+        if not self._callbacks:
+            self.finished.emit()
@@ -1,101 +1,177 @@
-import operator
+import heapq
+import json
 import pickle
-from copy import deepcopy
+from bisect import bisect_left, insort
+from warnings import warn
 
-import numpy as np
-
-from nat.annotation import Annotation
+from neurocurator.utils import atomic_open
 
 
 class TagSuggester:
+    """
+     Suggest tags from the tagging history (global scores) and from the tags
+     of the annotations of the current paper (local scores).
+
+     Tags are grouped by number of uses, in buckets kept up to date by
+     addUsedTag() and removeUsedTag(). Suggestions are then taken from the
+     most used buckets without sorting the whole history.
+
+     Modifications are not saved immediately. The owner calls save(), which
+     writes the history only if it has been modified since the last save.
+    """
+
+    # Version of the format of the saved history.
+    formatVersion = 1
 
     def __init__(self):
         self.usedTag = {}
         self.globalVsLocalRatio = 0.5
+        self.isModified = False
+        self.buildBuckets()
+
+    def buildBuckets(self):
+        # Number of uses -> tag IDs (dict used as an insertion-ordered set).
+        self.buckets = {}
+        for tagId, count in self.usedTag.items():
+            self.buckets.setdefault(count, {})[tagId] = None
+        # Distinct numbers of uses, in increasing order.
+        self.counts = sorted(self.buckets)
+
+    def __getstate__(self):
+        # NB: The buckets are derived from usedTag.
+        return {"usedTag": self.usedTag, "globalVsLocalRatio": self.globalVsLocalRatio}
+
+    def __setstate__(self, state):
+        self.usedTag = state["usedTag"]
+        self.globalVsLocalRatio = state["globalVsLocalRatio"]
+        self.isModified = False
+        self.buildBuckets()
 
     def addUsedTag(self, tagId):
-        if tagId in self.usedTag:
-            self.usedTag[tagId] += 1
-        else:
-            self.usedTag[tagId] = 1
-        self.save()
+        count = self.usedTag.get(tagId)
+        self.usedTag[tagId] = 1 if count is None else count + 1
+        self.moveToBucket(tagId, count, self.usedTag[tagId])
+        self.isModified = True
 
 
     def removeUsedTag(self, tagId):
-        if tagId in self.usedTag:
+        if tagId in self.usedTag and self.usedTag[tagId] > 0:
             self.usedTag[tagId] -= 1
-            self.save()
-
-
-
-    def suggestions(self, annotationFileName, selectedIds, numberOfSuggestions=30):
+            self.moveToBucket(tagId, self.usedTag[tagId] + 1, self.usedTag[tagId])
+            self.isModified = True
+
+
+    def moveToBucket(self, tagId, oldCount, newCount):
+        if oldCount is not None:
+            bucket = self.buckets[oldCount]
+            del bucket[tagId]
+            if not bucket:
+                del self.buckets[oldCount]
+                del self.counts[bisect_left(self.counts, oldCount)]
+        if newCount not in self.buckets:
+            self.buckets[newCount] = {}
+            insort(self.counts, newCount)
+        self.buckets[newCount][tagId] = None
+
+
+    def mostUsedTags(self):
+        """
+         Iterate over the IDs of the tags of the history, from the most used.
+        """
+        for count in reversed(self.counts):
+            yield from self.buckets[count]
+
+
+    def suggestions(self, localScores, selectedIds, numberOfSuggestions=30):
+        """
+         localScores gives the number of uses of the tags in the annotations
+         of the current paper (see PaperSession.tag_counts()).
+        """
         if len(self.usedTag) == 0:
             return []
 
-        tagScores = deepcopy(self.usedTag)
-        
         # Computing global indice
-        maxGlobalUse = np.max(list(tagScores.values())) / self.globalVsLocalRatio
+        maxGlobalUse = self.counts[-1] / self.globalVsLocalRatio
 
         # To avoid zero division
         if maxGlobalUse == 0:
             maxGlobalUse = 1.0 / self.globalVsLocalRatio
 
-        for key in tagScores:
-            tagScores[key] /= maxGlobalUse 
-
-
-
         # Computing local indices
-        localScores = {}
-        try :
-            with open(annotationFileName, 'r', encoding="utf-8", errors='ignore') as f:        
-                annots = Annotation.readIn(f)
-                for annot in annots:
-                    for tag in annot.tags:
-                        if tag.id in localScores:
-                            localScores[tag.id] += 1
-                        else:
-                            localScores[tag.id] = 1
-        except FileNotFoundError:
-            pass
-        
+        maxLocalUse = None
         if len(localScores):
-            maxLocallUse = np.max(list(localScores.values())) / (1.0 - self.globalVsLocalRatio)
-            for key in localScores:
-                if not key in tagScores:
-                    tagScores[key]  = localScores[key] / maxLocallUse
-                else:
-                    tagScores[key] += localScores[key] / maxLocallUse
+            maxLocalUse = max(localScores.values()) / (1.0 - self.globalVsLocalRatio)
 
+        selectedIds = set(selectedIds)
 
-        for key in selectedIds:
-            if key in tagScores:
-                del tagScores[key]
+        # Tags used in the paper have a local score added to their global score.
+        tagScores = {}
+        if maxLocalUse:
+            for tagId, localCount in localScores.items():
+                if tagId not in selectedIds:
+                    tagScores[tagId] = (self.usedTag.get(tagId, 0) / maxGlobalUse
+                                        + localCount / maxLocalUse)
 
+        # The other tags are ordered by their global score. Only the best ones
+        # can be in the suggestions.
+        nbGlobalTags = 0
+        for tagId in self.mostUsedTags():
+            if nbGlobalTags == numberOfSuggestions:
+                break
+            if tagId in selectedIds or tagId in tagScores:
+                continue
+            tagScores[tagId] = self.usedTag[tagId] / maxGlobalUse
+            nbGlobalTags += 1
 
-        if len(tagScores):
-            keys, values = zip(*sorted(tagScores.items(), key=operator.itemgetter(1) , reverse=True))
-            return list(keys[:min(numberOfSuggestions, len(keys))])
-        else:
-            return []
+        return heapq.nlargest(numberOfSuggestions, tagScores, key=tagScores.get)
 
 
     @staticmethod
-    def load(fileName="suggester.pickle"):
+    def load(fileName="suggester.json", legacyFileName="suggester.pickle"):
+        """
+         Load the saved history. If there is none, the history saved by the
+         previous versions (pickle) is loaded. It is converted at the next save.
+        """
         try:
-            with open(fileName, 'rb') as f:
-                return pickle.load(f)
-        except:
+            with open(fileName, "r", encoding="utf-8") as f:
+                content = json.load(f)
+            if content.get("version") != TagSuggester.formatVersion:
+                raise ValueError("Unsupported format version: " + str(content.get("version")))
+            suggester = TagSuggester()
+            suggester.globalVsLocalRatio = content["ratio"]
+            suggester.usedTag = dict(zip(content["ids"], content["counts"]))
+            suggester.buildBuckets()
+            return suggester
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            warn("Failed to load the tag suggestion history " + fileName + ": " + str(e))
             return TagSuggester()
 
-    def save(self, fileName="suggester.pickle"):
         try:
-            with open(fileName, 'wb') as f:
-                pickle.dump(self, f)
-        except:
-            pass
-
-
+            with open(legacyFileName, "rb") as f:
+                suggester = pickle.load(f)
+            suggester.isModified = True
+            return suggester
+        except FileNotFoundError:
+            return TagSuggester()
+        except Exception as e:
+            warn("Failed to load the tag suggestion history " + legacyFileName + ": " + str(e))
+            return TagSuggester()
 
-    
+    def save(self, fileName="suggester.json"):
+        """
+         Save the history if it has been modified since the last save.
+        """
+        if not self.isModified:
+            return
+        content = {"version": TagSuggester.formatVersion,
+                   "ratio": self.globalVsLocalRatio,
+                   "ids": list(self.usedTag.keys()),
+                   "counts": list(self.usedTag.values())}
+        try:
+            with atomic_open(fileName, "w", encoding="utf-8") as f:
+                json.dump(content, f, separators=(",", ":"))
+            self.isModified = False
+        except OSError as e:
+            warn("Failed to save the tag suggestion history " + fileName + ": " + str(e))
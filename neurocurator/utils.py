@@ -1,6 +1,8 @@
 __author__ = "Pierre-Alexandre Fonta"
 
 import os
+import tempfile
+from contextlib import contextmanager
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QFormLayout
@@ -16,3 +18,30 @@ def configure_form_layout(form_layout):
     form_layout.setFormAlignment(Qt.AlignLeft | Qt.AlignTop)
     form_layout.setLabelAlignment(Qt.AlignLeft)
     form_layout.setRowWrapPolicy(QFormLayout.DontWrapRows)
+
+
+@contextmanager
+def atomic_open(path, mode="w", **kwargs):
+    """Open a temporary file replacing the file at path when closed without error.
+
+    Readers of path see either the previous or the new content, never a
+    partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        try:
+            mode_bits = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode_bits = 0o644
+        # NB: mkstemp() creates files readable and writable only by the owner.
+        os.chmod(temporary_path, mode_bits)
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        raise
@@ -6,8 +6,7 @@ from PyQt5.QtCore import Qt, QAbstractTableModel
 from PyQt5.QtCore import pyqtSignal, pyqtSlot, QModelIndex
 from PyQt5.QtWidgets import QMessageBox, QTableView
 
-from nat.modelingParameter import (getParameterTypes, getParameterTypeIDFromName,
-                                   getParameterTypeFromID, ParameterTypeTree)
+from nat.modelingParameter import getParameterTypeIDFromName, getParameterTypeFromID
 from nat.paramDesc import ParamDescFunction, ParamDescTrace
 from nat.values import ValuesSimple, ValuesCompound
 from nat.variable import Variable, NumericalVariable
@@ -15,10 +14,6 @@ from .itemDelegates import (DoubleDelegate, ParamTypeDelegate, UnitDelegate,
                             StatisticsDelegate)
 
 
-parameterTypeTree = ParameterTypeTree.load()
-parameterTypes = getParameterTypes()
-
-
 class VariableTableView(QTableView):
 
     depTypeSelected  = pyqtSignal(str)
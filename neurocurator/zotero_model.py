@@ -1,16 +1,38 @@
 __authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
 __maintainer__ = "Pierre-Alexandre Fonta"
 
+from collections import namedtuple
+
 from PyQt5.QtCore import QModelIndex, Qt, QAbstractTableModel
 from PyQt5.QtGui import QColor, QBrush
 
-from nat.annotationSearch import AnnotationSearch
+from neurocurator.annotation_index import AnnotationCorpusIndex
+from neurocurator.paper_status import PaperStatusIndex
+from neurocurator.zotero_store import SyncCancelled
+
+
+# Zotero data built in a worker thread, to be applied to the model at once.
+# store: ZoteroStore with the references stored.
+# rows: displayed data of each reference of the store, see ZoteroTableModel.
+ZoteroSnapshot = namedtuple("ZoteroSnapshot", ["store", "rows"])
 
 
 class ZoteroTableModel(QAbstractTableModel):
+    """Table of the Zotero references, with their annotation counts and their status.
+
+    The displayed data are computed once per reference, when the references
+    are loaded or refreshed, in a worker thread. Painting, sorting and
+    filtering read them from a row table, without accessing the ZoteroWrap
+    nor the file system.
+    """
 
     HEADERS = ["ID", "Title", "Creators", "Year", "Journal", "Annotations"]
 
+    # Column indexes.
+    ID, TITLE, CREATORS, YEAR, JOURNAL, ANNOTATIONS = range(len(HEADERS))
+    # Index of the paper status (see check_id_fct) in a row, after the columns.
+    STATUS = len(HEADERS)
+
     def __init__(self, zotero_wrap, check_id_fct, annotations_path, parent=None):
         super().__init__(parent)
         # FIXME Delayed refactoring.
@@ -18,31 +40,103 @@ class ZoteroTableModel(QAbstractTableModel):
         # FIXME Delayed refactoring.
         self.annotations_path = annotations_path
         self._zotero_wrap = zotero_wrap
-        # TODO Cache them?
-        self._annotation_counts = []
-        # TODO For performance, create a data structure with only the displayed data?
+        # Displayed data of each reference: the columns, then the status.
+        self._rows = []
+        # Paper status -> background of the rows.
+        self._status_brushes = {2: QBrush(QColor(191, 237, 135), Qt.SolidPattern),
+                                1: QBrush(QColor(150, 150, 150), Qt.SolidPattern)}
 
     # Data I/O methods section.
 
     def load(self):
-        """Load the Zotero data and compute the annotation counts."""
-        self.layoutAboutToBeChanged.emit()
-        # TODO Implement an offline mode. Catch PyZoteroError.
+        """Load the Zotero data and compute the displayed data."""
+        self.set_loaded_data(self.read_data())
+
+    def read_data(self):
+        """Load the Zotero data and return the displayed data, without notifying the views.
+
+        Can be called from a worker thread. The model stays empty until
+        set_loaded_data() is called, in the GUI thread, with the result.
+        """
+        # NB: Stored Zotero data are used if there are some, even without network.
         self._zotero_wrap.initialize()
-        self._compute_annotation_counts()
-        self.layoutChanged.emit()
-
-    def refresh(self):
-        """Replace the cached Zotero data with the distant one."""
-        # TODO Displayed annotation counts will be inconsistent if new ones
-        # have been created during the refresh!
-        # TODO Only latest sorting kept. Row numbers change after in the proxy
-        # model in this case. Enforce all previous sorting after refresh()?
-        self.layoutAboutToBeChanged.emit()
-        # TODO Implement an offline mode. Catch PyZoteroError.
-        self._zotero_wrap.load_distant()
-        self._compute_annotation_counts()
-        self.layoutChanged.emit()
+        return self._build_rows(self._zotero_wrap)
+
+    def set_loaded_data(self, rows):
+        """Display the Zotero data loaded by read_data()."""
+        self.beginResetModel()
+        self._rows = rows
+        self.endResetModel()
+
+    def fetch_changes(self, progress=None, is_cancelled=None):
+        """Retrieve and store the distant changes of the Zotero data, without modifying the model.
+
+        Can be called from a worker thread. Return the up-to-date Zotero data
+        and displayed data as a ZoteroSnapshot, to be given to
+        apply_changes() in the GUI thread. Raise the exceptions of pyzotero
+        and requests if Zotero can't be reached.
+
+        progress and is_cancelled: see ZoteroStore.sync(). SyncCancelled is
+        raised if is_cancelled() returns True.
+        """
+        self._zotero_wrap.sync(progress, is_cancelled)
+        if is_cancelled is not None and is_cancelled():
+            raise SyncCancelled("The refresh of the Zotero references has been cancelled.")
+        if progress is not None:
+            progress(0, 0, "Counting the annotations of the Zotero references...")
+        store = self._zotero_wrap.snapshot()
+        return ZoteroSnapshot(store, self._build_rows(store))
+
+    def apply_changes(self, snapshot):
+        """Update the model with the ZoteroSnapshot returned by fetch_changes().
+
+        Done at once in the GUI thread: the views never see the model partly
+        updated.
+
+        The old and the new references are compared by key. Only the rows
+        removed, inserted or modified, including the annotation counts and the
+        statuses, are notified to the views. The other rows, and the sorting and
+        the selection of the views, are kept. New references are appended.
+        Return the number of rows changed.
+        """
+        store, new_data = snapshot
+        zotero_wrap = self._zotero_wrap
+        new_rows = {store.reference_key(i): i for i in range(store.reference_count())}
+
+        # NB: Removed from the last rows to keep the numbers of the other ones valid.
+        removed = [row for row in range(zotero_wrap.reference_count())
+                   if zotero_wrap.reference_key(row) not in new_rows]
+        for first, last in reversed(_ranges(removed)):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            zotero_wrap.remove_references(first, last)
+            del self._rows[first:last + 1]
+            self.endRemoveRows()
+
+        modified = []
+        for row in range(zotero_wrap.reference_count()):
+            new_row = new_rows[zotero_wrap.reference_key(row)]
+            if store.reference_version(new_row) != zotero_wrap.reference_version(row):
+                zotero_wrap.replace_reference(store.reference(new_row))
+            if new_data[new_row] != self._rows[row]:
+                self._rows[row] = new_data[new_row]
+                modified.append(row)
+        for first, last in _ranges(modified):
+            start_index = self.index(first, 0, QModelIndex())
+            end_index = self.index(last, self.columnCount() - 1, QModelIndex())
+            self.dataChanged.emit(start_index, end_index)
+
+        inserted = [new_row for new_row in range(store.reference_count())
+                    if zotero_wrap.reference_row(store.reference_key(new_row)) is None]
+        if inserted:
+            first = self.rowCount()
+            self.beginInsertRows(QModelIndex(), first, first + len(inserted) - 1)
+            for new_row in inserted:
+                zotero_wrap.replace_reference(store.reference(new_row))
+                self._rows.append(new_data[new_row])
+            self.endInsertRows()
+
+        zotero_wrap.set_metadata_from(store)
+        return len(removed) + len(modified) + len(inserted)
 
     # Qt interface implementation section.
 
@@ -60,23 +154,16 @@ class ZoteroTableModel(QAbstractTableModel):
         if self._is_index_too_large(row, column):
             return None
         if role == Qt.DisplayRole:
-            return self._cell_data(row, column)
+            # NB: Year and annotation count are int for sorting.
+            return self._rows[row][column]
         if role == Qt.BackgroundRole:
-            ref_id = self._zotero_wrap.reference_id(row)
-            if self.check_id_fct(ref_id) == 2:
-                color = QColor(191, 237, 135)
-                return QBrush(color, Qt.SolidPattern)
-            elif self.check_id_fct(ref_id) == 1:
-                color = QColor(150, 150, 150)
-                return QBrush(color, Qt.SolidPattern)
-            else:
-                return None
+            return self._status_brushes.get(self._rows[row][self.STATUS])
         return None
 
     def flags(self, index):
         if not index.isValid():
             return Qt.ItemIsEnabled
-        elif self.HEADERS[index.column()] == "Annotations":
+        elif index.column() == self.ANNOTATIONS:
             return super().flags(index) | Qt.ItemIsEditable
         else:
             return super().flags(index)
@@ -92,7 +179,8 @@ class ZoteroTableModel(QAbstractTableModel):
         if parent.isValid():
             return 0
         else:
-            return self._zotero_wrap.reference_count()
+            # NB: Empty until the Zotero data are loaded.
+            return len(self._rows)
 
     def setData(self, index, value, role=Qt.EditRole):
         if not index.isValid():
@@ -102,8 +190,8 @@ class ZoteroTableModel(QAbstractTableModel):
         if self._is_index_too_large(row, column):
             return False
         if role == Qt.EditRole:
-            if self.HEADERS[column] == 'Annotations':
-                self._set_annotation_count(row, value)
+            if column == self.ANNOTATIONS:
+                self._rows[row][column] = value
                 self.dataChanged.emit(index, index)
                 return True
         return False
@@ -112,10 +200,15 @@ class ZoteroTableModel(QAbstractTableModel):
 
     def add_reference(self, ref):
         """Add the reference at the end. Return the row as a QModelIndex."""
+        row = self._zotero_wrap.reference_row(ref["key"])
+        if row is not None:
+            # NB: Already retrieved by a refresh.
+            self.update_reference(row, ref)
+            return self.index(row, 0, QModelIndex())
         new_row = self.rowCount()
         self.beginInsertRows(QModelIndex(), new_row, new_row)
         self._zotero_wrap.create_local_reference(ref)
-        self._insert_annotation_count()
+        self._rows.append(self._build_row(self._zotero_wrap, new_row, 0))
         self.endInsertRows()
         # NB: Column number will not be used.
         return self.index(new_row, 0, QModelIndex())
@@ -123,33 +216,65 @@ class ZoteroTableModel(QAbstractTableModel):
     def update_reference(self, row, ref):
         """Update the reference at the given row."""
         self._zotero_wrap.update_local_reference(row, ref)
+        count = self._rows[row][self.ANNOTATIONS]
+        self._rows[row] = self._build_row(self._zotero_wrap, row, count)
         start_index = self.index(row, 0, QModelIndex())
         end_index = self.index(row, self.columnCount() - 2, QModelIndex())
         self.dataChanged.emit(start_index, end_index)
 
-    # Private @properties surrogates section.
-
-    def _annotation_count(self, row):
-        """Return the number of annotations of the reference at the given row."""
-        return self._annotation_counts[row]
+    def reference_ids(self):
+        """Return the IDs of the references, '' for the ones without ID."""
+        return [values[self.ID] for values in self._rows]
 
-    def _set_annotation_count(self, row, count):
-        """Set the number of annotations of the reference at the given row."""
-        self._annotation_counts[row] = count
+    def update_papers(self, paper_ids):
+        """Update the annotation count and the status of the references with these IDs.
 
-    def _insert_annotation_count(self):
-        """Insert an annotation count of value 0 at the end, for a new reference."""
-        self._annotation_counts.append(0)
+        To be called when the files of the papers in the annotation database change.
+        """
+        paper_ids = set(paper_ids)
+        if not paper_ids:
+            return
+        counts = AnnotationCorpusIndex.for_path(self.annotations_path).annotation_counts()
+        statuses = {paper_id: self.check_id_fct(paper_id) for paper_id in paper_ids}
+        for row, values in enumerate(self._rows):
+            paper_id = values[self.ID]
+            if paper_id not in statuses:
+                continue
+            values[self.ANNOTATIONS] = int(counts.get(paper_id, 0))
+            values[self.STATUS] = statuses[paper_id]
+            start_index = self.index(row, 0, QModelIndex())
+            end_index = self.index(row, self.columnCount() - 1, QModelIndex())
+            self.dataChanged.emit(start_index, end_index)
 
     # Private methods section.
 
-    def _compute_annotation_counts(self):
-        """Compute the number of annotations for all references and set it."""
-        # FIXME Delayed refactoring (related to search).
-        results = AnnotationSearch(self.annotations_path).search()
-        counts = results["Publication ID"].value_counts().to_dict()
-        self._annotation_counts = [int(counts.get(self._zotero_wrap.reference_id(i), 0))
-                                   for i in range(self._zotero_wrap.reference_count())]
+    def _build_rows(self, zotero_wrap):
+        """Return the displayed data of each reference of the ZoteroWrap."""
+        # NB: Only the annotation files modified since the last call are read.
+        corpus_index = AnnotationCorpusIndex.for_path(self.annotations_path)
+        corpus_index.update()
+        counts = corpus_index.annotation_counts()
+        # NB: One scan of the database directory, for the statuses given by check_id_fct.
+        PaperStatusIndex.for_path(self.annotations_path).update()
+        rows = []
+        for i in range(zotero_wrap.reference_count()):
+            ref_id = zotero_wrap.reference_id(i)
+            rows.append(self._build_row(zotero_wrap, i, int(counts.get(ref_id, 0)), ref_id))
+        return rows
+
+    def _build_row(self, zotero_wrap, index, annotation_count, ref_id=None):
+        """Return the displayed data of the reference: the columns, then the status."""
+        if ref_id is None:
+            ref_id = zotero_wrap.reference_id(index)
+        return [ref_id,
+                zotero_wrap.reference_title(index),
+                zotero_wrap.reference_creator_surnames_str(index),
+                # Int for sorting.
+                zotero_wrap.reference_year(index),
+                zotero_wrap.reference_journal(index),
+                # Int for sorting.
+                annotation_count,
+                self.check_id_fct(ref_id)]
 
     def _is_index_too_large(self, row, column):
         """Check if row and column numbers are not out of range.
@@ -159,20 +284,13 @@ class ZoteroTableModel(QAbstractTableModel):
         """
         return row >= self.rowCount() or column >= len(self.HEADERS)
 
-    def _cell_data(self, row, column):
-        """Return the attribute, in this column, of the reference in this row."""
-        header = self.HEADERS[column]
-        if header == "ID":
-            return self._zotero_wrap.reference_id(row)
-        elif header == "Title":
-            return self._zotero_wrap.reference_title(row)
-        elif header == "Creators":
-            return self._zotero_wrap.reference_creator_surnames_str(row)
-        elif header == "Year":
-            # Return int for sorting.
-            return self._zotero_wrap.reference_year(row)
-        elif header == "Journal":
-            return self._zotero_wrap.reference_journal(row)
-        elif header == 'Annotations':
-            # Return int for sorting.
-            return self._annotation_count(row)
+
+def _ranges(rows):
+    """Return as (first, last) the ranges of consecutive numbers of the sorted rows."""
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1] = (ranges[-1][0], row)
+        else:
+            ranges.append((row, row))
+    return ranges
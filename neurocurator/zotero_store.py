@@ -0,0 +1,294 @@
+__authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
+__maintainer__ = "Pierre-Alexandre Fonta"
+
+import copy
+import json
+import os
+import pickle
+import sqlite3
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from nat import ZoteroWrap
+
+
+# Changes of the Zotero library since the previously synchronized version.
+# version: library version after the changes.
+# updated: references created or modified.
+# deleted: keys of the references deleted.
+ZoteroChanges = namedtuple("ZoteroChanges", ["version", "updated", "deleted"])
+
+
+class ZoteroStore(ZoteroWrap):
+    """Zotero references kept in a local SQLite database, synchronized incrementally.
+
+    References are stored with their key and their version. A synchronization
+    retrieves only the references modified, and the keys of the references
+    deleted, since the last synchronized library version (Zotero 'since'
+    parameter). Without network, the stored references are used.
+
+    A synchronization has two steps. sync() retrieves and stores the changes.
+    It doesn't modify the references in memory and can be called from a
+    worker thread, like snapshot(). The stored references are then applied in
+    memory, reference per reference, with replace_reference() and
+    remove_references(), to let the Qt models notify their views of each row
+    changed.
+    """
+
+    # Number of references retrieved per request.
+    PAGE_SIZE = 100
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS reference (key TEXT PRIMARY KEY, version INTEGER,"
+        " position INTEGER, data TEXT)",
+        "CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)",
+    ]
+
+    def __init__(self, library_id, library_type, api_key, directory):
+        super().__init__(library_id, library_type, api_key, directory)
+        # NB: cache_path is the pickled cache of ZoteroWrap, imported if there is no database.
+        filename = "zotero-{}-{}.sqlite".format(library_type, library_id)
+        self.database_path = os.path.join(directory, filename)
+        # Version of the library the references in memory correspond to.
+        self.library_version = 0
+        # Reference key -> index in the reference list.
+        self._indexes = {}
+
+    # Data I/O methods section.
+
+    def load_cache(self):
+        """Load the stored Zotero data.
+
+        Raise FileNotFoundError if the library has never been synchronized.
+        """
+        if not os.path.exists(self.database_path) and os.path.exists(self.cache_path):
+            self._import_pickled_cache()
+        with self._connect() as connection:
+            version = self._metadata(connection, "library_version")
+            if version is None:
+                raise FileNotFoundError("No Zotero data stored in " + self.database_path)
+            rows = connection.execute("SELECT data FROM reference ORDER BY position")
+            references = [json.loads(data) for data, in rows]
+            reference_types = self._metadata(connection, "reference_types")
+            reference_templates = self._metadata(connection, "reference_templates")
+        self._references = references
+        self.reference_types = reference_types or []
+        self.reference_templates = reference_templates or OrderedDict()
+        self.library_version = version
+        self._update_indexes()
+
+    def load_distant(self):
+        """Retrieve all the distant Zotero data and replace the stored ones."""
+        version = self._zotero_lib.last_modified_version()
+        references = self.get_references()
+        reference_types = self.get_reference_types()
+        reference_templates = self.get_reference_templates(reference_types)
+        with self._connect() as connection:
+            connection.execute("DELETE FROM reference")
+            self._store_references(connection, references)
+            self._set_metadata(connection, "reference_types", reference_types)
+            self._set_metadata(connection, "reference_templates", reference_templates)
+            self._set_metadata(connection, "library_version", version)
+        self._references = references
+        self.reference_types = reference_types
+        self.reference_templates = reference_templates
+        self.library_version = version
+        self._update_indexes()
+
+    def cache(self):
+        """Store the Zotero data in memory."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM reference")
+            self._store_references(connection, self._references)
+            self._set_metadata(connection, "reference_types", self.reference_types)
+            self._set_metadata(connection, "reference_templates", self.reference_templates)
+            self._set_metadata(connection, "library_version", self.library_version)
+
+    def sync(self, progress=None, is_cancelled=None):
+        """Retrieve and store the distant changes since the last synchronization.
+
+        Return them as ZoteroChanges, to be applied to the references in memory.
+        Raise the exceptions of pyzotero and requests if Zotero can't be reached.
+
+        References moved to the trash since the last synchronization are
+        deleted, like the permanently deleted ones. References restored from
+        the trash get a new version, so they are retrieved as modified ones.
+
+        progress is called with the number of references retrieved, 0 (the
+        total is unknown) and a message. is_cancelled is called between two
+        requests. If it returns True, SyncCancelled is raised and nothing is
+        stored.
+        """
+        def check_cancelled():
+            if is_cancelled is not None and is_cancelled():
+                raise SyncCancelled("The synchronization of the Zotero references has been cancelled.")
+
+        def report(count, message):
+            if progress is not None:
+                progress(count, 0, message)
+
+        def retrieve_all(items, message):
+            # NB: Paginated like Zotero.everything(), checking for a cancellation between pages.
+            while self._zotero_lib.links and self._zotero_lib.links.get("next"):
+                check_cancelled()
+                items.extend(self._zotero_lib.follow())
+                report(len(items), message)
+            check_cancelled()
+            return items
+
+        with self._connect() as connection:
+            since = self._metadata(connection, "library_version") or 0
+        # NB: Retrieved first. Changes done meanwhile are retrieved again at the next sync.
+        version = self._zotero_lib.last_modified_version()
+        if version == since:
+            return ZoteroChanges(version, [], [])
+        message = "Retrieving the modified Zotero references..."
+        report(0, message)
+        updated = retrieve_all(self._zotero_lib.top(since=since, limit=self.PAGE_SIZE), message)
+        if since:
+            message = "Retrieving the deleted Zotero references..."
+            report(0, message)
+            deleted = self._zotero_lib.deleted(since=since).get("items", [])
+            check_cancelled()
+            # NB: top() leaves out the references in the trash, deleted() lists them only once
+            # the trash is emptied.
+            trashed = retrieve_all(self._zotero_lib.trash(since=since, limit=self.PAGE_SIZE), message)
+            deleted = sorted(set(deleted).union(ref["key"] for ref in trashed))
+        with self._connect() as connection:
+            if not since:
+                # NB: All the references have been retrieved. The other ones have been deleted.
+                updated_keys = {ref["key"] for ref in updated}
+                deleted = [key for key, in connection.execute("SELECT key FROM reference")
+                           if key not in updated_keys]
+            self._store_references(connection, updated)
+            connection.executemany("DELETE FROM reference WHERE key = ?", [(key,) for key in deleted])
+            if not self._metadata(connection, "reference_types"):
+                reference_types = self.get_reference_types()
+                self._set_metadata(connection, "reference_types", reference_types)
+                self._set_metadata(connection, "reference_templates",
+                                   self.get_reference_templates(reference_types))
+            self._set_metadata(connection, "library_version", version)
+        return ZoteroChanges(version, updated, deleted)
+
+    def create_local_reference(self, ref):
+        """Append the reference at the end of the reference list and store it."""
+        self.replace_reference(ref)
+        with self._connect() as connection:
+            self._store_references(connection, [ref])
+
+    def update_local_reference(self, index, ref):
+        """Replace the reference in the reference list and store it."""
+        self._references[index] = ref
+        self._indexes[ref["key"]] = index
+        with self._connect() as connection:
+            self._store_references(connection, [ref])
+
+    def snapshot(self):
+        """Return a copy of the store with the stored references, independent from this one.
+
+        Can be called from a worker thread. Raise FileNotFoundError if the
+        library has never been synchronized.
+        """
+        snapshot = copy.copy(self)
+        snapshot.load_cache()
+        return snapshot
+
+    # Public @properties surrogates section.
+
+    def reference(self, index):
+        """Return the reference, with its key, its version and its data."""
+        return self._references[index]
+
+    def reference_version(self, index):
+        """Return the version of the reference."""
+        return self._references[index].get("version", 0)
+
+    # Changes application section. In memory only, the changes are stored by sync().
+
+    def reference_row(self, ref_key):
+        """Return the index of the reference with this key, or None if there is none."""
+        return self._indexes.get(ref_key)
+
+    def replace_reference(self, ref):
+        """Replace the reference with the same key, or append it. Return its index."""
+        index = self._indexes.get(ref["key"])
+        if index is None:
+            index = len(self._references)
+            self._references.append(ref)
+            self._indexes[ref["key"]] = index
+        else:
+            self._references[index] = ref
+        return index
+
+    def remove_references(self, first, last):
+        """Remove the references from the index first to the index last, included."""
+        del self._references[first:last + 1]
+        self._update_indexes()
+
+    def set_metadata_from(self, store):
+        """Take the library version, the reference types and templates of the store.
+
+        Called once the references of the store have been applied.
+        """
+        self.library_version = store.library_version
+        self.reference_types = store.reference_types
+        self.reference_templates = store.reference_templates
+
+    # Private methods section.
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection, committed if no exception is raised, and close it.
+
+        NB: sqlite3 connections can't be shared between threads.
+        """
+        connection = sqlite3.connect(self.database_path)
+        try:
+            with connection:
+                for statement in self.SCHEMA:
+                    connection.execute(statement)
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _metadata(connection, name):
+        row = connection.execute("SELECT value FROM metadata WHERE name = ?", (name,)).fetchone()
+        # NB: OrderedDict to keep the order of the template fields.
+        return json.loads(row[0], object_pairs_hook=OrderedDict) if row else None
+
+    @staticmethod
+    def _set_metadata(connection, name, value):
+        connection.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                           (name, json.dumps(value)))
+
+    @staticmethod
+    def _store_references(connection, references):
+        """Insert or replace the references. New ones are positioned after the others."""
+        # NB: The position of a replaced reference is kept.
+        connection.executemany(
+            "INSERT OR REPLACE INTO reference (key, version, position, data) VALUES (?, ?,"
+            " COALESCE((SELECT position FROM reference WHERE key = ?),"
+            " (SELECT IFNULL(MAX(position) + 1, 0) FROM reference)), ?)",
+            [(ref["key"], ref.get("version", 0), ref["key"], json.dumps(ref)) for ref in references])
+
+    def _import_pickled_cache(self):
+        """Store the Zotero data cached by ZoteroWrap."""
+        with open(self.cache_path, "rb") as f:
+            cache = pickle.load(f)
+        references = cache[self.CACHE_REFERENCE_LIST]
+        # NB: Deletions before the cache was written are already in it. The
+        # ones after the most recent reference are retrieved at the next sync.
+        version = max((ref.get("version", 0) for ref in references), default=0)
+        with self._connect() as connection:
+            self._store_references(connection, references)
+            self._set_metadata(connection, "reference_types", cache[self.CACHE_REFERENCE_TYPES])
+            self._set_metadata(connection, "reference_templates", cache[self.CACHE_REFERENCE_TEMPLATES])
+            self._set_metadata(connection, "library_version", version)
+
+    def _update_indexes(self):
+        self._indexes = {ref["key"]: index for index, ref in enumerate(self._references)}
+
+
+class SyncCancelled(Exception):
+    """Raise when the synchronization of the Zotero references is cancelled."""
@@ -1,19 +1,46 @@
 __authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
 __maintainer__ = "Pierre-Alexandre Fonta"
 
-from PyQt5.QtCore import QThread
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from neurocurator.zotero_store import SyncCancelled
 
 
 class ZoteroRefreshThread(QThread):
 
+    # Emitted with the current count, the maximum count (0 if unknown) and a message.
+    progress = pyqtSignal(int, int, str)
+
     def __init__(self, zotero_model, parent=None):
         super().__init__(parent)
         # NB: Executes in the old thread.
         self._zotero_model = zotero_model
+        # Result of the last run: the ZoteroSnapshot built, or the exception raised.
+        self.result = None
+        self.error = None
+        self.is_cancelled = False
 
     def run(self):
         # NB: Executes in the new thread. Beware of accessing __init__() variables.
         # NB: Returning from this method will end the execution of the thread.
-        # QMutex/QMutexLocker not needed if ZoteroTableModel is not modified.
+        # QMutex/QMutexLocker not needed: the model is not modified here. The
+        # snapshot built is applied to it in the GUI thread, once finished.
         # QThread::exec() not needed if an event loop inside the thread is not needed.
-        self._zotero_model.refresh()
+        self.result = None
+        self.error = None
+        self.is_cancelled = False
+        try:
+            self.result = self._zotero_model.fetch_changes(self.progress.emit, self.isInterruptionRequested)
+        except SyncCancelled:
+            self.is_cancelled = True
+        except Exception as e:
+            # NB: Zotero can't be reached. The stored data are kept.
+            self.error = e
+        if self.isInterruptionRequested():
+            # NB: Requested too late to stop. The changes stored are applied by the next refresh.
+            self.result = None
+            self.is_cancelled = True
+
+    def cancel(self):
+        """Request the refresh to stop. The model is not modified if it stops."""
+        self.requestInterruption()
@@ -1,19 +1,27 @@
 __authors__ = ["Pierre-Alexandre Fonta", "Christian O'Reilly"]
 __maintainer__ = "Pierre-Alexandre Fonta"
 
-from PyQt5.QtCore import Qt, pyqtSlot, QSortFilterProxyModel
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot, QSortFilterProxyModel
 from PyQt5.QtWidgets import (QAbstractItemView, QWidget, QTableView,
                              QVBoxLayout, QLineEdit, QFormLayout)
 
-from nat import ZoteroWrap
 from neurocurator import utils
 from neurocurator.zotero_edition import ZoteroReferenceDialog
 from neurocurator.zotero_model import ZoteroTableModel
+from neurocurator.zotero_store import ZoteroStore
 from neurocurator.zotero_thread import ZoteroRefreshThread
 
 
 class ZoteroTableWidget(QWidget):
 
+    # Emitted with the number of references created, modified or deleted by a refresh.
+    refreshed = pyqtSignal(int)
+    # Emitted with the error message when Zotero can't be reached for a refresh.
+    refreshFailed = pyqtSignal(str)
+    refreshCancelled = pyqtSignal()
+    # Emitted with the current count, the maximum count (0 if unknown) and a message.
+    refreshProgress = pyqtSignal(int, int, str)
+
     def __init__(self, settings, directory, check_id_fct, annotations_path, parent=None):
         super().__init__(parent)
         # FIXME Delayed refactoring of check_id_fct and annotations_path.
@@ -23,12 +31,14 @@ class ZoteroTableWidget(QWidget):
         library_id = settings["libraryID"]
         library_type = settings["libraryType"]
         api_key = settings["apiKey"]
-        self._zotero = ZoteroWrap(library_id, library_type, api_key, directory)
+        # NB: The references are stored locally and synchronized incrementally.
+        self._zotero = ZoteroStore(library_id, library_type, api_key, directory)
 
         # Widgets section.
 
+        # NB: Empty until the Zotero data are loaded, see load_data().
         model = ZoteroTableModel(self._zotero, check_id_fct, annotations_path)
-        model.load()
+        self._model = model
 
         proxy_model = QSortFilterProxyModel()
         proxy_model.setSourceModel(model)
@@ -67,8 +77,8 @@ class ZoteroTableWidget(QWidget):
         # Signals section.
 
         self.filter_edit.textChanged.connect(proxy_model.setFilterFixedString)
-        self.refresh_thread.started.connect(self.refresh_started)
         self.refresh_thread.finished.connect(self.refresh_finished)
+        self.refresh_thread.progress.connect(self.refreshProgress)
 
     # def __del__(self):
     #     # FIXME Delayed refactoring. Not called when application is closed. Incorrect parent use?
@@ -79,8 +89,37 @@ class ZoteroTableWidget(QWidget):
     #     self.refresh_thread.wait()
     #     print("DEBUG: ZoteroRefreshThread.wait() returned")
 
+    # Data I/O methods section.
+
+    def load_data(self):
+        """Load the Zotero data. Return them to be given to data_loaded().
+
+        Executed in a worker thread at the startup. The widget is disabled
+        until data_loaded() is called, in the GUI thread.
+        """
+        return self._model.read_data()
+
+    def reference_ids(self):
+        """Return the IDs of the references, '' for the ones without ID."""
+        return self._model.reference_ids()
+
+    def update_papers(self, paper_ids):
+        """Update the displayed annotation count and status of the papers with these IDs."""
+        self._model.update_papers(paper_ids)
+
     # Slots section.
 
+    @pyqtSlot()
+    def loading_started(self):
+        """Disable the Zotero widget until its data are loaded."""
+        self.setDisabled(True)
+
+    @pyqtSlot(object)
+    def data_loaded(self, data):
+        """Display the Zotero data returned by load_data() and enable the widget."""
+        self._model.set_loaded_data(data)
+        self.setEnabled(True)
+
     @pyqtSlot()
     def refresh_database(self):
         """Start the thread refreshing the Zotero data.
@@ -90,23 +129,25 @@ class ZoteroTableWidget(QWidget):
         self.refresh_thread.start()
 
     @pyqtSlot()
-    def refresh_started(self):
-        """Disable the Zotero widget when the thread refreshing its data runs.
-
-        Disable handling of keyboard/mouse events to ensure a thread-safe refresh.
-        """
-        # TODO Display an information on top of the disabled widget.
-        self.setDisabled(True)
+    def cancel_refresh(self):
+        """Stop the thread refreshing the Zotero data, without modifying the displayed data."""
+        self.refresh_thread.cancel()
 
     @pyqtSlot()
     def refresh_finished(self):
-        """Enable the Zotero widget when the thread refreshing its data finishes.
+        """Apply the changes retrieved by the thread refreshing the Zotero data.
 
-        Reset the selection model of the view in case of new/deleted references.
-        Enable again the handling of keyboard/mouse events.
+        The widget stays usable while the thread runs: it doesn't modify the
+        model. Without network, the stored data are kept. Only the rows which changed
+        are updated. The sorting and the selection of the view are kept.
         """
-        self.view.selectionModel().reset()
-        self.setEnabled(True)
+        result = self.refresh_thread.result
+        if result is not None:
+            self.refreshed.emit(self._model.apply_changes(result))
+        elif self.refresh_thread.is_cancelled:
+            self.refreshCancelled.emit()
+        else:
+            self.refreshFailed.emit(str(self.refresh_thread.error))
 
     @pyqtSlot()
     def add_reference(self):